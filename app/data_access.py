@@ -0,0 +1,163 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import streamlit as st
+
+from cubes import REVENUE_BAND_WIDTH, REVENUE_BANDS, build_momentum_cube, cube_file, momentum_cube_file, read_cube
+from name_index import NameIndex, load_name_index
+from query_service import RegionQuery, default_revenue_cap
+from schema import conform, csv_dtypes
+from scoring import apply_scoring, compile_features
+from storage import map_snapshot, read_table, resolve, write_snapshot
+from what_if import ScoreSweep
+from zip_map import LEVELS, ZipLayer, layer_file
+
+REGIONS_PATH = Path("data/regions.json")
+PROFILES_NAME = "org_master_profiles_scored.parquet"
+MOMENTUM_NAME = "momentum_classification.parquet"
+NAME_INDEX_NAME = "name_index.joblib"
+DUPLICATES_NAME = "duplicate_orgs.csv"
+
+# Objects returned here are cached with st.cache_resource and shared by every rerun
+# (and every session), so callers must treat them as read-only: derive, don't mutate.
+# Each loader is keyed on the region's directory and the file's mtime, so a pipeline
+# rerun invalidates it. Tables that only exist as CSV so far are read from the CSV
+# (see storage.read_table).
+#
+# Profiles are held in the compact schema.py types and memory-mapped from an Arrow
+# snapshot next to the table (storage.map_snapshot), so each region's data is one copy
+# in the page cache however many sessions, or dashboard processes, are reading it.
+#
+# A region is served when its data/regions.json entry has a `data_dir` holding its
+# scored profiles (plus, optionally, `label` and the slider's `revenue_cap` in dollars).
+
+
+def dashboard_regions(path=REGIONS_PATH):
+    with open(path, "r") as f:
+        config = json.load(f)
+    regions = {}
+    for name, region in config["regions"].items():
+        if "data_dir" in region and resolve(Path(region["data_dir"]) / PROFILES_NAME).exists():
+            regions[name] = {
+                "label": region.get("label", name.title()),
+                "data_dir": region["data_dir"],
+                "revenue_cap": region.get("revenue_cap"),
+            }
+    return regions
+
+
+def _mtime(path):
+    return resolve(path).stat().st_mtime_ns
+
+
+@st.cache_resource(show_spinner="Loading org profiles…", max_entries=8)
+def _read_profiles(path, mtime):
+    snapshot = resolve(path).with_suffix(".arrow")
+    if not snapshot.exists() or snapshot.stat().st_mtime_ns < mtime:
+        write_snapshot(conform(read_table(path, csv_dtype=csv_dtypes()), compact=True), snapshot)
+    return conform(map_snapshot(snapshot), compact=True)
+
+
+@st.cache_resource(show_spinner="Indexing org names…", max_entries=8)
+def _name_index(path, mtime):
+    # Written by name_index.py; built here when missing, stale or not row-aligned
+    df = _read_profiles(path, mtime)
+    index_path = Path(path).parent / NAME_INDEX_NAME
+    if index_path.exists() and index_path.stat().st_mtime_ns >= mtime:
+        index = load_name_index(index_path)
+        if np.array_equal(index.eins, df["EIN"].to_numpy(dtype=np.int64)):
+            return index
+    return NameIndex(df)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _score_features(path, mtime, rules):
+    return compile_features(_read_profiles(path, mtime), rules)
+
+
+@st.cache_resource(show_spinner="Indexing org profiles…", max_entries=16)
+def _region_query(data_dir, mtime, revenue_cap, rules, tuned_rules):
+    # `tuned_rules` is part of the key because re-scoring changes PRIORITY_SCORE / TARGET_FLAG;
+    # sessions trying the same weights share the re-scored view too
+    path = str(Path(data_dir) / PROFILES_NAME)
+    df = _read_profiles(path, mtime)
+    revenue_cap = revenue_cap or default_revenue_cap(df["REVENUE"].to_numpy(dtype="float64"))
+
+    cube = None
+    if tuned_rules != rules:
+        df = apply_scoring(df, tuned_rules, features=_score_features(path, mtime, rules))
+    else:
+        # Use the cube written by score_targets.py unless it is stale or banded for another cap
+        cube_path = Path(data_dir) / cube_file.name
+        if revenue_cap == REVENUE_BANDS * REVENUE_BAND_WIDTH and cube_path.exists() and cube_path.stat().st_mtime_ns >= mtime:
+            cube = read_cube(cube_path)
+    return RegionQuery(df, revenue_cap, cube, names=_name_index(path, mtime))
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _score_sweep(path, mtime, rules):
+    # Keyed on the rules' structure only: sweeps pass the sidebar weights as their baseline
+    return ScoreSweep(_score_features(path, mtime, rules), rules)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _momentum_cube(data_dir, momentum_mtime, profiles_mtime):
+    # Written by merge_and_score.py; rebuilt from the momentum file when missing or stale
+    cube_path = Path(data_dir) / momentum_cube_file.name
+    if cube_path.exists() and cube_path.stat().st_mtime_ns >= momentum_mtime:
+        return read_table(cube_path)
+    momentum = conform(read_table(
+        Path(data_dir) / MOMENTUM_NAME,
+        columns=["EIN", "MOMENTUM_CLASS", "MOMENTUM_SCORE"],
+        csv_dtype=csv_dtypes(),
+    ))
+    profiles = _read_profiles(str(Path(data_dir) / PROFILES_NAME), profiles_mtime)
+    return build_momentum_cube(momentum.merge(profiles[["EIN", "SECTOR"]], on="EIN", how="left"))
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def _duplicates(path, mtime):
+    return read_table(path, csv_dtype=csv_dtypes()).astype({"EIN_A": "int64", "EIN_B": "int64"})
+
+
+@st.cache_resource(show_spinner="Loading ZIP map…", max_entries=8)
+def _zip_layer(data_dir, mtime):
+    return ZipLayer(data_dir)
+
+
+def load_region_query(region, rules, tuned_rules):
+    # The shared query service for `region`'s profiles scored with `tuned_rules`
+    path = Path(region["data_dir"]) / PROFILES_NAME
+    return _region_query(region["data_dir"], _mtime(path), region["revenue_cap"], rules, tuned_rules)
+
+
+def load_score_sweep(region, rules):
+    # What-if scoring over `region`'s profiles; rows line up with load_region_query(...).df
+    path = Path(region["data_dir"]) / PROFILES_NAME
+    return _score_sweep(str(path), _mtime(path), rules)
+
+
+def load_momentum_cube(region):
+    # None when the region has no momentum classification
+    data_dir = Path(region["data_dir"])
+    if not resolve(data_dir / MOMENTUM_NAME).exists():
+        return None
+    return _momentum_cube(str(data_dir), _mtime(data_dir / MOMENTUM_NAME), _mtime(data_dir / PROFILES_NAME))
+
+
+def load_duplicates(region):
+    # Likely duplicate org pairs from name_index.py; None when the region has none listed
+    path = Path(region["data_dir"]) / DUPLICATES_NAME
+    if not path.exists():
+        return None
+    return _duplicates(str(path), _mtime(path))
+
+
+def load_zip_layer(region):
+    # ZIP boundaries from build_zip_layer.py; None when the region has no layers yet
+    data_dir = Path(region["data_dir"])
+    paths = [layer_file(data_dir, level) for level in LEVELS]
+    if not all(path.exists() for path in paths):
+        return None
+    return _zip_layer(str(data_dir), max(_mtime(path) for path in paths))
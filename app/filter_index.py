@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+# === In-memory filter index over the org profiles ===
+# Built once per data version. Sidebar filters become bitmap ANDs and binary searches
+# instead of fresh column scans on every rerun:
+#   - categorical columns: one packed bitmap (1 bit per row) per value
+#   - numeric range columns: values sorted once, ranges answered with searchsorted
+#   - prefix columns (ZIP): strings sorted once, a prefix is a contiguous slice
+
+
+def _bitmap_from_rows(rows, n):
+    mask = np.zeros(n, dtype=bool)
+    mask[rows] = True
+    return np.packbits(mask)
+
+
+class FilterIndex:
+    def __init__(self, df, categorical=(), ranges=(), prefixes=()):
+        self.n = len(df)
+        self.bitmaps = {}
+        self.any_value = {}
+        self.sorted_values = {}
+        self.sorted_rows = {}
+
+        for col in categorical:
+            codes, uniques = pd.factorize(df[col], sort=True)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            self.bitmaps[col] = {
+                value: _bitmap_from_rows(order[bounds[i]:bounds[i + 1]], self.n)
+                for i, value in enumerate(uniques)
+            }
+            self.any_value[col] = _bitmap_from_rows(np.flatnonzero(codes >= 0), self.n)
+
+        for col in ranges:
+            values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+            rows = np.flatnonzero(~np.isnan(values))
+            order = rows[np.argsort(values[rows], kind="stable")]
+            self.sorted_values[col] = values[order]
+            self.sorted_rows[col] = order
+
+        for col in prefixes:
+            present = df[col].notna().to_numpy()
+            rows = np.flatnonzero(present)
+            values = df[col].astype(str).to_numpy()[rows].astype("U")
+            order = np.argsort(values, kind="stable")
+            self.sorted_values[col] = values[order]
+            self.sorted_rows[col] = rows[order]
+
+    def options(self, col):
+        # Sorted distinct values of a categorical column (for multiselects)
+        return list(self.bitmaps[col])
+
+    def _category_bitmap(self, col, selected):
+        bitmaps = self.bitmaps[col]
+        if selected is None or len(selected) >= len(bitmaps):
+            return self.any_value[col]
+        picked = [bitmaps[v] for v in selected if v in bitmaps]
+        if not picked:
+            return np.zeros_like(self.any_value[col])
+        return np.bitwise_or.reduce(picked)
+
+    def _range_bitmap(self, col, low, high):
+        values = self.sorted_values[col]
+        lo = np.searchsorted(values, low, side="left")
+        hi = np.searchsorted(values, high, side="right")
+        return _bitmap_from_rows(self.sorted_rows[col][lo:hi], self.n)
+
+    def _prefix_bitmap(self, col, prefix):
+        values = self.sorted_values[col]
+        lo = np.searchsorted(values, prefix, side="left")
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        hi = np.searchsorted(values, upper, side="left")
+        return _bitmap_from_rows(self.sorted_rows[col][lo:hi], self.n)
+
+    def query(self, ranges=None, categories=None, prefixes=None):
+        # Returns positional row indices (in original order) matching every condition
+        bitmaps = []
+        for col, (low, high) in (ranges or {}).items():
+            bitmaps.append(self._range_bitmap(col, low, high))
+        for col, selected in (categories or {}).items():
+            bitmaps.append(self._category_bitmap(col, selected))
+        for col, prefix in (prefixes or {}).items():
+            if prefix:
+                bitmaps.append(self._prefix_bitmap(col, prefix))
+
+        if not bitmaps:
+            return np.arange(self.n)
+        mask = np.bitwise_and.reduce(bitmaps)
+        return np.flatnonzero(np.unpackbits(mask, count=self.n))
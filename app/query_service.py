@@ -0,0 +1,146 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from cubes import REVENUE_BAND_WIDTH, build_cube, can_answer, cube_mask, rollup
+from filter_index import FilterIndex
+from name_index import NameIndex
+from perf import timed
+from table_view import csv_file, page_rows, ranked, score_rank
+
+# === Region query service ===
+# Everything the dashboard asks of one region's profiles (as scored with one set of
+# rules), answered in place. data_access.py builds one of these per region, data version
+# and rules, and every session shares it, so sessions never hold their own frames: they
+# send filters and get back row positions, a page, aggregates or a CSV.
+#
+# Filters are a dict:
+#   {"revenue": (low, high), "priority": (low, high),
+#    "categories": {"SECTOR": [...] or None, ...}, "zip_prefix": "152", "name": "treasure hous"}
+# A None category selection means any value, and an empty (or missing) name any name; a
+# name is matched fuzzily through the region's NameIndex (see name_index.py). CLUSTER_ID
+# (from cluster_orgs.py) is only indexed when the region's profiles have it, and the cube
+# carries neither it nor names, so a cluster selection or name search is answered from the rows.
+
+CATEGORY_COLUMNS = ["SECTOR", "TARGET_FLAG", "MOMENTUM_CLASS", "CLUSTER_ID"]
+
+
+def default_revenue_cap(revenue, band_width=REVENUE_BAND_WIDTH, quantile=0.995):
+    # Slider max for regions that don't set one: the 99.5th percentile of positive
+    # revenue, rounded up to a whole band, so a few giants don't flatten the charts
+    positive = revenue[revenue > 0]
+    if len(positive) == 0:
+        return band_width
+    return max(1, math.ceil(float(np.quantile(positive, quantile)) / band_width)) * band_width
+
+
+def zip5_codes(zips):
+    # Each row's 5-digit ZIP ("15213-2654" -> "15213") as codes into the distinct ZIP5s,
+    # -1 where missing; worked out once per distinct ZIP, not per row
+    zips = zips.astype("category")
+    short = pd.Series(zips.cat.categories.astype(str)).str.strip().str[:5].str.zfill(5)
+    codes, uniques = pd.factorize(short)
+    rows = np.where(zips.cat.codes.to_numpy() >= 0, codes[zips.cat.codes.to_numpy()], -1)
+    return rows, np.asarray(uniques, dtype=object)
+
+
+class RegionQuery:
+    def __init__(self, df, revenue_cap=None, cube=None, band_width=REVENUE_BAND_WIDTH, names=None):
+        self.df = df
+        self.band_width = band_width
+        self.revenue_cap = revenue_cap or default_revenue_cap(df["REVENUE"].to_numpy(dtype=np.float64), band_width)
+        self.bands = self.revenue_cap // band_width
+        categorical = [col for col in CATEGORY_COLUMNS if col in df.columns]
+        self.index = FilterIndex(df, categorical=categorical, ranges=["REVENUE", "PRIORITY_SCORE"], prefixes=["ZIP"])
+        self.rank = score_rank(df["PRIORITY_SCORE"])
+        self.cube = cube if cube is not None else build_cube(df, band_width, self.bands)
+        self.names = names if names is not None else NameIndex(df)
+        self.has_negative_revenue = bool((df["REVENUE"] < 0).any())
+        self.zip_codes, self.zips = zip5_codes(df["ZIP"])
+        # Sector codes for the map; the extra last code stands for "no sector"
+        codes, sectors = pd.factorize(df["SECTOR"]) if "SECTOR" in df.columns else (np.full(len(df), -1), [])
+        self.sectors = np.append(np.asarray(sectors, dtype=object), None)
+        self.sector_codes = np.where(codes >= 0, codes, len(self.sectors) - 1)
+
+    # --- What the sidebar needs ---
+    def options(self, col):
+        return self.index.options(col)
+
+    def has_column(self, col):
+        return col in self.df.columns
+
+    def score_bounds(self):
+        scores = self.index.sorted_values["PRIORITY_SCORE"]
+        return (int(scores[0]), int(scores[-1])) if len(scores) else (0, 0)
+
+    # --- Row-level answers ---
+    @timed()
+    def match(self, filters):
+        # Positions of the orgs matching every filter (ascending)
+        rows = self.index.query(
+            ranges={"REVENUE": filters["revenue"], "PRIORITY_SCORE": filters["priority"]},
+            categories=filters["categories"],
+            prefixes={"ZIP": filters["zip_prefix"]},
+        )
+        if filters.get("name"):
+            rows = self.names.matches(filters["name"], rows)
+        return rows
+
+    @timed()
+    def search(self, text, rows, limit, columns=None):
+        # The `limit` orgs among `rows` whose names best match `text`, best first, with
+        # NAME_MATCH = % similarity of their closest name to the query
+        found, similarity = self.names.search(text, rows, limit)
+        matches = self.df.iloc[found]
+        matches = matches[columns] if columns else matches
+        return matches.assign(NAME_MATCH=(similarity * 100).round().astype(int))
+
+    @timed()
+    def page(self, rows, start, stop, columns=None):
+        # Ranked positions [start, stop) of `rows`, highest priority first
+        page = self.df.iloc[page_rows(self.rank, rows, start, stop)]
+        return page[columns] if columns else page
+
+    def csv(self, rows):
+        return csv_file(self.df, ranked(self.rank, rows))
+
+    def over_cap(self, columns):
+        # Orgs above the slider's revenue cap, shown separately
+        return self.df.loc[self.df["REVENUE"] > self.revenue_cap, columns]
+
+    # --- Aggregates ---
+    @timed()
+    def flag_counts(self, filters, rows):
+        # Org counts by SECTOR x TARGET_FLAG for the filters: from the cube when it can
+        # answer exactly, else from the matching rows (`rows` = match(filters))
+        categories = {col: selected for col, selected in filters["categories"].items() if col in self.cube.columns}
+        off_cube = bool(filters.get("name")) or any(
+            selected is not None and col not in categories for col, selected in filters["categories"].items()
+        )
+        if not off_cube and can_answer(filters["revenue"], filters["zip_prefix"], self.band_width, self.bands):
+            mask = cube_mask(self.cube, filters["revenue"], filters["priority"], categories,
+                             filters["zip_prefix"], self.band_width)
+            counts = rollup(self.cube, ["SECTOR", "TARGET_FLAG"], mask)
+            return counts.rename(columns={"ORG_COUNT": "count"})[["SECTOR", "TARGET_FLAG", "count"]]
+        matched = self.df.iloc[rows]
+        matched = matched[matched["REVENUE"] <= self.revenue_cap]
+        return matched.groupby(["SECTOR", "TARGET_FLAG"], observed=True).size().reset_index(name="count")
+
+    @timed()
+    def zip_counts(self, rows):
+        # Org count, total revenue and most common sector per 5-digit ZIP among `rows` (orgs
+        # under the cap, as in the charts), for the map
+        revenue = self.df["REVENUE"].to_numpy(dtype=np.float64)[rows]
+        codes = self.zip_codes[rows]
+        keep = (codes >= 0) & (revenue <= self.revenue_cap)
+        counts = np.bincount(codes[keep], minlength=len(self.zips))
+        totals = np.bincount(codes[keep], weights=revenue[keep], minlength=len(self.zips))
+        width = len(self.sectors)
+        by_sector = np.bincount(codes[keep] * width + self.sector_codes[rows][keep], minlength=len(self.zips) * width)
+        by_sector = by_sector.reshape(len(self.zips), width)
+        by_sector[:, -1] = 0  # orgs without a sector don't make "no sector" dominant
+        dominant = np.where(by_sector.any(axis=1), by_sector.argmax(axis=1), width - 1)
+        shown = counts > 0
+        return pd.DataFrame({"ZIP": self.zips[shown], "ORG_COUNT": counts[shown], "TOTAL_REVENUE": totals[shown],
+                             "DOMINANT_SECTOR": self.sectors[dominant[shown]]})
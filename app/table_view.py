@@ -0,0 +1,45 @@
+import tempfile
+
+import numpy as np
+
+# === Paged view over the filtered orgs ===
+# The main table never materialises (or sends) the whole filtered result: rows are put
+# in PRIORITY_SCORE order through a rank array computed once per scoring version, only
+# the visible page is sliced out of the shared frame, and the CSV download is written
+# chunk by chunk when it's clicked.
+
+
+def score_rank(scores):
+    # rank[i] = where row i lands ordered by score, highest first (ties keep file order)
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    return rank
+
+
+def ranked(rank, rows):
+    # All of `rows` (positions) in rank order
+    return rows[np.argsort(rank[rows])]
+
+
+def page_rows(rank, rows, start, stop):
+    # The rows at ranked positions [start, stop): argpartition picks the first `stop`,
+    # so only those get sorted
+    stop = min(stop, len(rows))
+    if start >= stop:
+        return rows[:0]
+    keys = rank[rows]
+    top = np.argpartition(keys, stop - 1)[:stop] if stop < len(rows) else np.arange(len(rows))
+    top = top[np.argsort(keys[top])]
+    return rows[top[start:stop]]
+
+
+def csv_file(df, rows, chunk_rows=20_000):
+    # CSV of df.iloc[rows] in an unbuffered temp file (deleted once closed), for
+    # st.download_button; each chunk is converted and written on its own
+    f = tempfile.TemporaryFile(mode="w+b", buffering=0)
+    for i in range(0, max(len(rows), 1), chunk_rows):
+        chunk = df.iloc[rows[i:i + chunk_rows]]
+        f.write(chunk.to_csv(header=i == 0, index=False).encode())
+    f.seek(0)
+    return f
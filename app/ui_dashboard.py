@@ -1,19 +1,57 @@
-import pandas as pd
+import math
+import sys
+import time
+from pathlib import Path
+
 import plotly.express as px
 import streamlit as st
 
-# === Load primary data ===
-df = pd.read_csv("data/processed/org_master_profiles_scored.csv")
-momentum_df = pd.read_csv("data/processed/momentum_classification.csv")
-
-# Check for negative revenue
-has_negative_revenue = (df["REVENUE"] < 0).any()
+sys.path.append(str(Path(__file__).resolve().parents[1] / "scripts"))
+from perf import Tracer, activate, log_path
+from scoring import feature_weights, load_rules, with_weights
+from data_access import (
+    dashboard_regions, load_duplicates, load_momentum_cube, load_region_query, load_score_sweep, load_zip_layer,
+)
+from what_if import config_grid
 
 # === Streamlit Setup ===
 st.set_page_config(page_title="Target Dashboard", layout="wide")
 st.title("📊 Smart Grant Solutions — Sales Intelligence Dashboard")
 
-if has_negative_revenue:
+# === Timings (one tracer per interaction, see scripts/perf.py) ===
+# On when "Show timings" was ticked on the last run or PERF_LOG is set for the server
+tracer = activate(Tracer("dashboard", enabled=st.session_state.get("show_perf", False), log_path=log_path()))
+tracer.context["session"] = st.session_state.setdefault("perf_session", tracer.run)
+
+# === Region (each region's data is loaded once and shared, see data_access.py) ===
+regions = dashboard_regions()
+if not regions:
+    st.error("❌ No region has scored profiles yet. Run the pipeline first (see README).")
+    st.stop()
+region_name = st.sidebar.selectbox("Region", list(regions), format_func=lambda name: regions[name]["label"])
+region = regions[region_name]
+tracer.context["region"] = region_name
+
+# === Scoring Weights (re-score without re-running the pipeline) ===
+rules = load_rules()
+with st.sidebar.expander("⚖️ Scoring Weights"):
+    weights = {
+        name: st.number_input(name, value=weight, step=5)
+        for name, weight in feature_weights(rules)
+    }
+    cutoffs = {
+        flag: st.number_input(f"{flag} (min score)", value=cutoff, step=5)
+        for flag, cutoff in rules["flags"].items()
+    }
+tuned_rules = with_weights(rules, weights, cutoffs)
+
+# Filters, pages and aggregates are all answered by the shared query service
+query = load_region_query(region, rules, tuned_rules)
+revenue_cap = query.revenue_cap
+revenue_cap_label = f"${revenue_cap / 1_000_000:,.0f}M"
+tracer.mark("load region", rows=len(query.df))
+
+if query.has_negative_revenue:
     st.warning(
         "⚠️ Some organizations report negative revenue. While rare, this may reflect accounting nuances or reporting errors. "
         "These values are retained in the dataset, but the default view excludes them."
@@ -22,67 +60,158 @@ if has_negative_revenue:
 # === Sidebar Filters ===
 st.sidebar.header("Filter Orgs")
 
-def fallback_multiselect(label, options):
-    selection = st.sidebar.multiselect(label, sorted(options))
-    return selection if selection else list(options)
+def fallback_multiselect(label, column):
+    # An empty selection means any value
+    selection = st.sidebar.multiselect(label, query.options(column))
+    return selection if selection else None
 
 # Revenue filter range
-filtered_revenue_min = 0
-filtered_revenue_max = 200_000_000
+excluded_columns = ["ORG_NAME", "REVENUE", "PRIORITY_SCORE", "SECTOR", "TARGET_FLAG", "MOMENTUM_CLASS"]
+excluded_df = query.over_cap(excluded_columns)
 
 st.sidebar.markdown(
-    "⚠️ For visualization clarity, orgs with revenue above **$200M** are excluded from the default slider range. "
-    "There are 19 such orgs, and they are displayed separately below."
+    f"⚠️ For visualization clarity, orgs with revenue above **{revenue_cap_label}** are excluded from the default slider range. "
+    f"There are {len(excluded_df):,} such orgs, and they are displayed separately below."
 )
 
 revenue_range = st.sidebar.slider(
     "Revenue (USD)",
-    min_value=filtered_revenue_min,
-    max_value=filtered_revenue_max,
-    value=(filtered_revenue_min, filtered_revenue_max),
-    step=1_000_000
+    min_value=0,
+    max_value=revenue_cap,
+    value=(0, revenue_cap),
+    step=query.band_width
 )
 
+score_min, score_max = query.score_bounds()
 priority_range = st.sidebar.slider(
     "Priority Score",
-    min_value=int(df["PRIORITY_SCORE"].min()),
-    max_value=int(df["PRIORITY_SCORE"].max()),
-    value=(int(df["PRIORITY_SCORE"].min()), int(df["PRIORITY_SCORE"].max()))
+    min_value=score_min,
+    max_value=score_max,
+    value=(score_min, score_max)
 )
 
-sectors = fallback_multiselect("Sector", df["SECTOR"].dropna().unique())
-flags = fallback_multiselect("Target Flag", df["TARGET_FLAG"].dropna().unique())
-momentums = fallback_multiselect("Momentum Class", df["MOMENTUM_CLASS"].dropna().unique())
+sectors = fallback_multiselect("Sector", "SECTOR")
+flags = fallback_multiselect("Target Flag", "TARGET_FLAG")
+momentums = fallback_multiselect("Momentum Class", "MOMENTUM_CLASS")
 zip_prefix = st.sidebar.text_input("ZIP (prefix)", "")
+name_query = st.sidebar.text_input("Org name", "", help="Typos and partial names are fine")
+categories = {"SECTOR": sectors, "TARGET_FLAG": flags, "MOMENTUM_CLASS": momentums}
 
-# === Apply Filters ===
-filtered_df = df[
-    (df["REVENUE"] >= revenue_range[0]) &
-    (df["REVENUE"] <= revenue_range[1]) &
-    (df["PRIORITY_SCORE"].between(*priority_range)) &
-    (df["SECTOR"].isin(sectors)) &
-    (df["TARGET_FLAG"].isin(flags)) &
-    (df["MOMENTUM_CLASS"].isin(momentums))
-]
+# Clusters come from scripts/cluster_orgs.py (see data/processed/cluster_summary.csv)
+if query.has_column("CLUSTER_ID"):
+    categories["CLUSTER_ID"] = fallback_multiselect("Cluster", "CLUSTER_ID")
 
-if zip_prefix:
-    filtered_df = filtered_df[filtered_df["ZIP"].astype(str).str.startswith(zip_prefix)]
+st.sidebar.checkbox("⏱️ Show timings", key="show_perf", help="Time every step of each interaction (shown at the bottom)")
+tracer.mark("sidebar")
 
-st.markdown(f"**{len(filtered_df):,} organizations match the filters.**")
+# === Apply Filters ===
+filters = {
+    "revenue": revenue_range,
+    "priority": priority_range,
+    "categories": categories,
+    "zip_prefix": zip_prefix,
+    "name": name_query.strip(),
+}
+rows = query.match(filters)
+st.markdown(f"**{len(rows):,} organizations match the filters.**")
+tracer.mark("match filters", rows=len(rows))
+
+# === Name Search (trigram index, see scripts/name_index.py) ===
+if filters["name"]:
+    st.subheader("🔎 Best Name Matches")
+    name_columns = ["ORG_NAME", "NAME", "EIN", "CITY", "SECTOR", "REVENUE", "PRIORITY_SCORE", "TARGET_FLAG"]
+    name_matches = query.search(filters["name"], rows, limit=25, columns=[c for c in name_columns if query.has_column(c)])
+    st.dataframe(name_matches.reset_index(drop=True), use_container_width=True)
+    tracer.mark("name search", rows=len(name_matches))
 
 # === Data Table (centerpiece) ===
+# One page at a time, highest priority first (see table_view.py)
 st.subheader("📋 Explore the Filtered Organizations")
-st.dataframe(
-    filtered_df.sort_values(by="PRIORITY_SCORE", ascending=False).reset_index(drop=True),
-    use_container_width=True
+all_columns = list(query.df.columns)
+default_columns = [
+    "ORG_NAME", "EIN", "CITY", "ZIP", "SECTOR", "SIZE_BUCKET", "REVENUE",
+    "MOMENTUM_CLASS", "CLUSTER_ID", "IS_HOLLOW", "IS_TURBULENT", "PRIORITY_SCORE", "TARGET_FLAG",
+]
+visible_columns = st.multiselect(
+    "Columns", all_columns, default=[c for c in default_columns if c in all_columns]
+) or all_columns
+
+size_col, page_col, download_col = st.columns([1, 1, 2])
+page_size = size_col.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+pages = max(1, math.ceil(len(rows) / page_size))
+page = page_col.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, value=1, step=1)
+start = (page - 1) * page_size
+
+page_df = query.page(rows, start, start + page_size, visible_columns)
+st.dataframe(page_df.reset_index(drop=True), use_container_width=True)
+if len(rows):
+    st.caption(f"Rows {start + 1:,}–{start + len(page_df):,} of {len(rows):,}, by priority score")
+
+download_col.download_button(
+    "⬇️ Download filtered orgs (CSV)",
+    data=lambda: query.csv(rows),
+    file_name=f"filtered_orgs_{region_name}.csv",
+    mime="text/csv",
+    on_click="ignore",
 )
+tracer.mark("table page", rows=len(page_df))
+
+# Pairs listed by scripts/name_index.py with either org among the filtered ones
+duplicates = load_duplicates(region)
+if duplicates is not None:
+    in_view = query.df["EIN"].iloc[rows]
+    shown = duplicates[duplicates["EIN_A"].isin(in_view) | duplicates["EIN_B"].isin(in_view)]
+    with st.expander(f"🧬 Possible Duplicate Orgs ({len(shown):,} pairs)"):
+        st.markdown("Orgs under different EINs with nearly the same name. Worth checking before outreach.")
+        st.dataframe(shown, use_container_width=True, hide_index=True)
+tracer.mark("duplicates")
+
+# === ZIP Map ===
+st.subheader("🗺️ Filtered Orgs by ZIP")
+
+# Shapes are precomputed by scripts/build_zip_layer.py; here they're only picked by ZIP,
+# at the finest zoom level that keeps the map light enough to send (see zip_map.py)
+zip_layer = load_zip_layer(region)
+if not zip_layer:
+    st.info("No ZIP boundaries yet. Add the Census ZCTA file to data/raw and rerun the pipeline (see README).")
+else:
+    zip_counts = query.zip_counts(rows)
+    mapped = zip_layer.mapped(zip_counts["ZIP"])
+    zip_counts = zip_counts[zip_counts["ZIP"].isin(mapped)]
+    unmapped = len(rows) - int(zip_counts["ORG_COUNT"].sum())
+    if not mapped:
+        st.info("None of the filtered orgs are in a mapped ZIP.")
+    else:
+        map_metric = st.radio("Color by", ["ORG_COUNT", "TOTAL_REVENUE"], horizontal=True,
+                              format_func=lambda m: {"ORG_COUNT": "Org count", "TOTAL_REVENUE": "Total revenue"}[m])
+        level = zip_layer.level_for(mapped)
+        center, zoom = zip_layer.view(mapped)
+        fig_map = px.choropleth_map(
+            zip_counts,
+            geojson=zip_layer.geojson(mapped, level),
+            locations="ZIP",
+            featureidkey="properties.ZIP",
+            color=map_metric,
+            hover_data=["ORG_COUNT", "TOTAL_REVENUE", "DOMINANT_SECTOR"],
+            color_continuous_scale="Viridis",
+            map_style="carto-positron",
+            center=center,
+            zoom=zoom,
+            opacity=0.6,
+        )
+        fig_map.update_layout(margin=dict(t=10, b=10, l=0, r=0), height=550)
+        st.plotly_chart(fig_map, use_container_width=True)
+        st.caption(f"{len(mapped):,} ZIPs, {level} detail.")
+    if unmapped:
+        st.caption(f"{unmapped:,} filtered orgs aren't on the map: above the revenue cap, or in ZIPs without a boundary (e.g. PO boxes).")
+tracer.mark("zip map")
 
 # === Chart 1: Target Flag by Sector (split Unknown) ===
 st.subheader("📊 Target Flag Distribution by Sector")
 st.markdown("This shows how different org types (target flags) are distributed across sectors. 'Unknown' is shown separately below.")
 
-chart_df = filtered_df[filtered_df["REVENUE"] <= filtered_revenue_max]
-flag_sector = chart_df.groupby(["SECTOR", "TARGET_FLAG"]).size().reset_index(name="count")
+# Rolled up from the pre-aggregated cube where it can answer exactly
+flag_sector = query.flag_counts(filters, rows)
 
 known_flag_sector = flag_sector[flag_sector["SECTOR"] != "Unknown"]
 unknown_flag_sector = flag_sector[flag_sector["SECTOR"] == "Unknown"]
@@ -110,39 +239,113 @@ if not unknown_flag_sector.empty:
         title="Target Flag Count — Unknown Sector Only"
     )
     st.plotly_chart(fig_unknown, use_container_width=True)
+tracer.mark("flag chart", rows=len(flag_sector))
 
 # === Chart 2: Momentum Watchlist Breakdown ===
 st.subheader("🔥 Momentum Watchlist by Sector & Class")
 st.markdown("Average momentum scores grouped by sector and classification. Chart scaled to highlight meaningful signal only (−0.5 to 1.5).")
 
-# Merge EIN → SECTOR
-merged = pd.merge(momentum_df, df[["EIN", "SECTOR"]], on="EIN", how="left")
-merged = merged[merged["SECTOR"].notna() & (merged["SECTOR"] != "Unknown")]
+# Pre-aggregated clipped sums/counts by sector & class (see cubes.build_momentum_cube)
+grouped = load_momentum_cube(region)
+if grouped is None:
+    st.info("No momentum classification for this region yet.")
+else:
+    grouped = grouped.assign(MOMENTUM_SCORE_CLIPPED=grouped["MOMENTUM_SUM"] / grouped["MOMENTUM_COUNT"])
 
-# Clip downward momentum more tightly (bottomed at −0.5)
-merged["MOMENTUM_SCORE_CLIPPED"] = merged["MOMENTUM_SCORE"].clip(lower=-0.5, upper=1.5)
+    fig2 = px.bar(
+        grouped,
+        x="SECTOR",
+        y="MOMENTUM_SCORE_CLIPPED",
+        color="MOMENTUM_CLASS",
+        barmode="group",
+        title="Avg Momentum Score by Sector & Class (Scale: -0.5 to 1.5)"
+    )
+    fig2.update_layout(
+        xaxis_tickangle=45,
+        yaxis_range=[-0.5, 1.5],
+        margin=dict(t=40, b=60),
+    )
+    st.plotly_chart(fig2, use_container_width=True)
+tracer.mark("momentum chart")
 
-grouped = merged.groupby(["SECTOR", "MOMENTUM_CLASS"])["MOMENTUM_SCORE_CLIPPED"].mean().reset_index()
+# === What-if Scoring Sweep ===
+st.subheader("🧪 What-if Scoring Sweep")
+st.markdown(
+    "Try a whole range of weights or flag cutoffs at once (e.g. *what if hollow orgs weighed 50 instead of 40?*). "
+    "Every setting is compared against the weights in the sidebar: how many orgs land in each flag, "
+    "and how many of the current top orgs stay on top."
+)
 
-fig2 = px.bar(
-    grouped,
-    x="SECTOR",
-    y="MOMENTUM_SCORE_CLIPPED",
-    color="MOMENTUM_CLASS",
-    barmode="group",
-    title="Avg Momentum Score by Sector & Class (Scale: -0.5 to 1.5)"
+# Every config is scored in one batched matrix product (see scripts/what_if.py)
+sweep = load_score_sweep(region, rules)
+current = {**weights, **cutoffs}
+params = list(weights) + list(cutoffs)
+
+step_col, top_col = st.columns(2)
+sweep_step = step_col.selectbox("Sweep step", [1, 2, 5, 10], index=2)
+top_n = top_col.number_input("Leaderboard size (top N)", min_value=1, max_value=1000, value=50, step=10)
+
+ranges = {}
+for i, col in enumerate(st.columns(2)):
+    name = col.selectbox(f"Vary #{i + 1}", params if i == 0 else ["(nothing)"] + params, key=f"sweep_param_{i}")
+    if name == "(nothing)" or name in ranges:
+        continue
+    low, high = col.slider(f"{name} from / to", -50, 150, (0, 100), step=sweep_step, key=f"sweep_range_{i}")
+    ranges[name] = list(range(low, high + 1, sweep_step))
+
+configs = [{**current, **config} for config in config_grid(ranges)]
+started = time.perf_counter()
+sweep_df = sweep.run(configs, top_n=top_n, baseline=current)
+st.caption(f"Scored {len(configs):,} configurations over {sweep.n:,} orgs in {(time.perf_counter() - started) * 1000:,.0f} ms.")
+
+flag_columns = [flag.upper() for flag in list(rules["flags"]) + [rules["default_flag"]]]
+sweep_df = sweep_df[list(ranges) + flag_columns + ["TOP_N_KEPT", "TOP_N_NEW"]]
+swept = list(ranges)
+
+chart_flag = st.selectbox("Flag to chart", flag_columns + ["TOP_N_KEPT"])
+fig3 = px.line(
+    sweep_df.assign(**{swept[-1]: sweep_df[swept[-1]].astype(str)}) if len(swept) > 1 else sweep_df,
+    x=swept[0],
+    y=chart_flag,
+    color=swept[-1] if len(swept) > 1 else None,
+    markers=True,
+    title=f"{chart_flag} by {' & '.join(swept)}"
 )
-fig2.update_layout(
-    xaxis_tickangle=45,
-    yaxis_range=[-0.5, 1.5],
-    margin=dict(t=40, b=60),
+st.plotly_chart(fig3, use_container_width=True)
+st.dataframe(sweep_df, use_container_width=True, hide_index=True)
+tracer.mark("what-if sweep", rows=len(configs))
+
+# Who moves in and out of the top N for one of the configs
+pick = st.selectbox(
+    "Leaderboard changes for",
+    sweep_df.index,
+    format_func=lambda i: ", ".join(f"{name} = {sweep_df.at[i, name]}" for name in swept)
 )
-st.plotly_chart(fig2, use_container_width=True)
+entered, dropped = sweep.leaderboard_changes(configs[pick], top_n=top_n, baseline=current)
+
+def leaderboard_table(positions):
+    return query.df.iloc[positions][["ORG_NAME", "SECTOR", "REVENUE"]].assign(
+        SCORE_NOW=sweep.org_scores(current, positions),
+        SCORE_WHAT_IF=sweep.org_scores(configs[pick], positions),
+    ).reset_index(drop=True)
+
+enter_col, drop_col = st.columns(2)
+enter_col.markdown(f"**⬆️ {len(entered)} orgs enter the top {top_n}**")
+enter_col.dataframe(leaderboard_table(entered), use_container_width=True)
+drop_col.markdown(f"**⬇️ {len(dropped)} orgs drop out**")
+drop_col.dataframe(leaderboard_table(dropped), use_container_width=True)
+tracer.mark("leaderboard changes", rows=len(entered) + len(dropped))
 
 # === Excluded High-Revenue Orgs ===
-st.subheader("🚨 Excluded Orgs Over $200M Revenue")
-excluded_df = df[df["REVENUE"] > filtered_revenue_max][[
-    "ORG_NAME", "REVENUE", "PRIORITY_SCORE", "SECTOR", "TARGET_FLAG", "MOMENTUM_CLASS"
-]]
-st.markdown(f"**{len(excluded_df):,} organizations have revenue over $200M.**")
-st.dataframe(excluded_df.reset_index(drop=True), use_container_width=True)
\ No newline at end of file
+st.subheader(f"🚨 Excluded Orgs Over {revenue_cap_label} Revenue")
+st.markdown(f"**{len(excluded_df):,} organizations have revenue over {revenue_cap_label}.**")
+st.dataframe(excluded_df.reset_index(drop=True), use_container_width=True)
+tracer.mark("excluded orgs", rows=len(excluded_df))
+
+# === Performance ===
+# Steps add up to the total; "call" rows are the query service and storage calls inside them
+tracer.finish(rows=len(rows))
+if st.session_state.get("show_perf") and tracer.enabled:
+    total = tracer.records[-1]["ms"]
+    with st.expander(f"⏱️ Performance ({total:,.0f} ms this interaction)", expanded=True):
+        st.dataframe(tracer.records, use_container_width=True, hide_index=True)
@@ -1,83 +1,213 @@
+import argparse
 import pandas as pd
 from pathlib import Path
 import numpy as np
 
-# === Load the financial timeseries ===
-df = pd.read_csv("data/processed/financial_timeseries.csv")
-output_file = Path("data/processed/momentum_classification.csv")
+from perf import script_tracer
+from schema import conform
+from storage import incremental_eins, read_table, upsert_rows, write_table
+
+input_file = Path("data/processed/financial_timeseries.parquet")
+output_file = Path("data/processed/momentum_classification.parquet")
+
+COLUMNS = [
+    "EIN", "ORG_NAME", "AVG_RECENT_REVENUE", "AVG_PRIOR_REVENUE",
+    "PCT_CHANGE", "MOMENTUM_SCORE", "VOLATILITY", "MOMENTUM_CLASS",
+]
+
+
+def prepare(df):
+    # Clean and drop nulls
+    df = df.dropna(subset=["REVENUE", "YEAR"])
+    return df.sort_values(by=["EIN", "YEAR"])
+
+
+def round_like_python(values, digits):
+    # np.round scales by 10**digits first, which can tip a value sitting on a .5 tie the
+    # other way; builtin round() is exact, so use it for the handful of near-tie values
+    out = np.round(values, digits)
+    scaled = values * 10.0 ** digits
+    near_tie = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    out[near_tie] = [round(v, digits) for v in values[near_tie].tolist()]
+    return out
+
+
+def classify(pct_change, momentum, volatility):
+    conditions = [
+        volatility > 0.5,
+        (pct_change > 20) & (momentum > 0),
+        (pct_change < -20) & (momentum < 0),
+        (pct_change > 5) & (pct_change <= 20),
+        (pct_change >= -20) & (pct_change < -5),
+        np.abs(pct_change) <= 5,
+    ]
+    labels = ["turbulent", "strong_momentum_up", "strong_momentum_down", "weak_up", "weak_down", "stable"]
+    return np.select(conditions, labels, default="uncategorized")
+
+
+# === Vectorized momentum ===
+def compute_momentum(df):
+    df = prepare(df)
+    eins = df["EIN"].to_numpy()
+    revs = df["REVENUE"].to_numpy(dtype=np.float64)
+    if len(df) == 0:
+        return pd.DataFrame(columns=COLUMNS)
+
+    # Groups are contiguous after the sort: find where each EIN starts
+    starts = np.flatnonzero(np.r_[True, eins[1:] != eins[:-1]])
+    sizes = np.diff(np.r_[starts, len(eins)])
+    ends = starts + sizes
+
+    # Volatility = std / mean over every year on file, computed the way pandas does
+    # (pairwise sum, then two-pass variance) so the rounded values match exactly
+    sums = np.add.reduceat(revs, starts)
+    means = sums / sizes
+    sq_dev = (np.repeat(means, sizes) - revs) ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.sqrt(np.add.reduceat(sq_dev, starts) / (sizes - 1))
+        volatility = std / means
+
+    # Must have at least 6 years; take the last 6 as a (groups, 6) window
+    keep = sizes >= 6
+    window_idx = ends[keep, None] + np.arange(-6, 0)
+    window = revs[window_idx]
+    prior, recent = window[:, :3], window[:, 3:]
+
+    sum_recent = recent[:, 0] + recent[:, 1] + recent[:, 2]
+    sum_prior = prior[:, 0] + prior[:, 1] + prior[:, 2]
+    valid = (sum_recent >= 1) & (sum_prior >= 1)
+
+    recent, sum_recent, sum_prior = recent[valid], sum_recent[valid], sum_prior[valid]
+    rows = starts[keep][valid]
+
+    avg_recent = sum_recent / 3
+    avg_prior = sum_prior / 3
+    pct_change = round_like_python((avg_recent - avg_prior) / avg_prior * 100, 2)
 
-# Ensure numeric types
-df["REVENUE"] = pd.to_numeric(df["REVENUE"], errors="coerce")
-df["YEAR"] = pd.to_numeric(df["YEAR"], errors="coerce")
+    # === Normalized Momentum ===
+    raw_momentum = (recent[:, 2] - recent[:, 1]) + (recent[:, 1] - recent[:, 0])
+    normalized_momentum = round_like_python(raw_momentum / avg_recent, 4)
 
-# Clean and drop nulls
-df = df.dropna(subset=["REVENUE", "YEAR"])
-df = df.sort_values(by=["EIN", "YEAR"])
+    vol = round_like_python(volatility[keep][valid], 3)
 
-results = []
+    return pd.DataFrame({
+        "EIN": eins[rows],
+        "ORG_NAME": df["ORG_NAME"].to_numpy()[rows],
+        "AVG_RECENT_REVENUE": np.trunc(avg_recent).astype(np.int64),
+        "AVG_PRIOR_REVENUE": np.trunc(avg_prior).astype(np.int64),
+        "PCT_CHANGE": pct_change,
+        "MOMENTUM_SCORE": normalized_momentum,
+        "VOLATILITY": vol,
+        "MOMENTUM_CLASS": classify(pct_change, normalized_momentum, vol),
+    })
 
-# === Analyze by EIN ===
-for ein, group in df.groupby("EIN"):
-    org_name = group["ORG_NAME"].iloc[0]
 
-    # Must have at least 6 years
-    if len(group) < 6:
-        continue
+# === Reference implementation (original per-EIN loop), kept for --verify ===
+def compute_momentum_loop(df):
+    df = prepare(df)
+    results = []
+
+    for ein, group in df.groupby("EIN"):
+        org_name = group["ORG_NAME"].iloc[0]
 
-    revs = group["REVENUE"].tolist()
-    years = group["YEAR"].tolist()
+        # Must have at least 6 years
+        if len(group) < 6:
+            continue
 
-    recent = revs[-3:]  # most recent 3 years
-    prior = revs[-6:-3]  # 3 years before that
+        revs = group["REVENUE"].tolist()
 
-    if sum(recent) < 1 or sum(prior) < 1:
-        continue
+        recent = revs[-3:]  # most recent 3 years
+        prior = revs[-6:-3]  # 3 years before that
 
-    avg_recent = sum(recent) / len(recent)
-    avg_prior = sum(prior) / len(prior)
+        if sum(recent) < 1 or sum(prior) < 1:
+            continue
 
-    pct_change = (avg_recent - avg_prior) / avg_prior
-    pct_change = round(pct_change * 100, 2)
+        avg_recent = sum(recent) / len(recent)
+        avg_prior = sum(prior) / len(prior)
 
-    # === Normalized Momentum ===
-    raw_momentum = (recent[2] - recent[1]) + (recent[1] - recent[0])
-    normalized_momentum = raw_momentum / avg_recent
-    normalized_momentum = round(normalized_momentum, 4)
-
-    # Volatility = std / mean
-    volatility = pd.Series(revs).std() / pd.Series(revs).mean()
-    volatility = round(volatility, 3)
-
-    # === Classify ===
-    if volatility > 0.5:
-        label = "turbulent"
-    elif pct_change > 20 and normalized_momentum > 0:
-        label = "strong_momentum_up"
-    elif pct_change < -20 and normalized_momentum < 0:
-        label = "strong_momentum_down"
-    elif 5 < pct_change <= 20:
-        label = "weak_up"
-    elif -20 <= pct_change < -5:
-        label = "weak_down"
-    elif abs(pct_change) <= 5:
-        label = "stable"
-    else:
-        label = "uncategorized"
-
-    results.append({
-        "EIN": ein,
-        "ORG_NAME": org_name,
-        "AVG_RECENT_REVENUE": int(avg_recent),
-        "AVG_PRIOR_REVENUE": int(avg_prior),
-        "PCT_CHANGE": pct_change,
-        "MOMENTUM_SCORE": normalized_momentum,
-        "VOLATILITY": volatility,
-        "MOMENTUM_CLASS": label
-    })
+        pct_change = (avg_recent - avg_prior) / avg_prior
+        pct_change = round(pct_change * 100, 2)
+
+        raw_momentum = (recent[2] - recent[1]) + (recent[1] - recent[0])
+        normalized_momentum = raw_momentum / avg_recent
+        normalized_momentum = round(normalized_momentum, 4)
+
+        # Volatility = std / mean
+        volatility = pd.Series(revs).std() / pd.Series(revs).mean()
+        volatility = round(volatility, 3)
+
+        # === Classify ===
+        if volatility > 0.5:
+            label = "turbulent"
+        elif pct_change > 20 and normalized_momentum > 0:
+            label = "strong_momentum_up"
+        elif pct_change < -20 and normalized_momentum < 0:
+            label = "strong_momentum_down"
+        elif 5 < pct_change <= 20:
+            label = "weak_up"
+        elif -20 <= pct_change < -5:
+            label = "weak_down"
+        elif abs(pct_change) <= 5:
+            label = "stable"
+        else:
+            label = "uncategorized"
+
+        results.append({
+            "EIN": ein,
+            "ORG_NAME": org_name,
+            "AVG_RECENT_REVENUE": int(avg_recent),
+            "AVG_PRIOR_REVENUE": int(avg_prior),
+            "PCT_CHANGE": pct_change,
+            "MOMENTUM_SCORE": normalized_momentum,
+            "VOLATILITY": volatility,
+            "MOMENTUM_CLASS": label
+        })
+
+    return pd.DataFrame(results, columns=COLUMNS)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Classify revenue momentum per EIN")
+    parser.add_argument("--input", type=Path, default=input_file)
+    parser.add_argument("--output", type=Path, default=output_file)
+    parser.add_argument("--verify", action="store_true", help="Also run the original loop and check the outputs match")
+    parser.add_argument("--changed-eins", type=Path, help="Only recompute these EINs (one per line) and upsert them into --output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    tracer = script_tracer("analyze_momentum", incremental=bool(opts.changed_eins))
+
+    eins, filters = incremental_eins(opts.changed_eins, opts.output)
+    if eins == []:
+        return
+
+    # === Load the financial timeseries ===
+    df = read_table(opts.input, columns=["EIN", "ORG_NAME", "YEAR", "REVENUE"], filters=filters)
+    tracer.mark("load", rows=len(df))
+
+    out = compute_momentum(df)
+    tracer.mark("momentum", rows=len(out))
+
+    if opts.verify:
+        expected = compute_momentum_loop(df)
+        pd.testing.assert_frame_equal(out, expected, check_dtype=False, check_exact=True)
+        print("🔁 Vectorized output matches the per-EIN loop")
+        tracer.mark("verify", rows=len(df))
 
-# Save results
-out = pd.DataFrame(results)
-out.to_csv(output_file, index=False)
+    if eins is not None:
+        print(f"🔁 Recomputed {len(eins)} changed EINs ({len(out)} classified)")
+        out = upsert_rows(read_table(opts.output), conform(out), eins).sort_values("EIN", kind="stable")
+        tracer.mark("upsert", rows=len(out))
 
-print(f"✅ Momentum classification saved to {output_file}")
-print(f"📊 Orgs classified: {len(out)}")
\ No newline at end of file
+    # Save results
+    write_table(conform(out), opts.output)
+    tracer.mark("save", rows=len(out))
+
+    print(f"✅ Momentum classification saved to {opts.output}")
+    print(f"📊 Orgs classified: {len(out)}")
+
+
+if __name__ == "__main__":
+    main()
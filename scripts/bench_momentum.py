@@ -0,0 +1,53 @@
+import argparse
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from analyze_momentum import compute_momentum, compute_momentum_loop, input_file
+
+
+# === Scale the real timeseries by tiling it with shifted EINs ===
+def tile(df, factor):
+    span = int(df["EIN"].max()) + 1
+    copies = []
+    for i in range(factor):
+        part = df.copy()
+        part["EIN"] = part["EIN"] + i * span
+        copies.append(part)
+    return pd.concat(copies, ignore_index=True)
+
+
+def timed(fn, df):
+    start = time.perf_counter()
+    out = fn(df)
+    return out, time.perf_counter() - start
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark vectorized momentum against the per-EIN loop")
+    parser.add_argument("--input", type=Path, default=input_file)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--loop-max-scale", type=int, default=10, help="Skip the slow loop above this scale")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    base = pd.read_parquet(opts.input, columns=["EIN", "ORG_NAME", "YEAR", "REVENUE"])
+    print(f"📥 Base timeseries: {len(base):,} rows, {base['EIN'].nunique():,} EINs")
+
+    for factor in opts.scales:
+        df = tile(base, factor)
+        fast, fast_s = timed(compute_momentum, df)
+        line = f"x{factor:<4} {len(df):>11,} rows | vectorized {fast_s:8.3f}s"
+
+        if factor <= opts.loop_max_scale:
+            slow, slow_s = timed(compute_momentum_loop, df)
+            pd.testing.assert_frame_equal(fast, slow, check_dtype=False, check_exact=True)
+            line += f" | loop {slow_s:8.3f}s | {slow_s / fast_s:6.1f}x faster, outputs identical"
+        print(f"⏱️ {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from run_pipeline import run_stage
+
+repo_root = Path(__file__).resolve().parents[1]
+scripts_dir = repo_root / "scripts"
+bench_dir = Path("data/bench")
+work_dir = bench_dir / "work"
+results_dir = bench_dir / "results"
+baseline_file = bench_dir / "baseline.json"
+
+CONFIG_FILES = ["data/regions.json", "data/sector_map.json", "data/scoring_rules.json"]
+
+
+# === Stages to time ===
+# Each runs as its own process inside a synthetic workspace, in pipeline order. `rows` names
+# the table (or JSON directory) whose size the stage's rows/sec is measured against.
+def stage_rows(path):
+    path = Path(path)
+    if path.is_dir():
+        return sum(1 for _ in os.scandir(path))
+    if path.suffix == ".csv":
+        with open(path, "rb") as f:
+            return sum(1 for _ in f) - 1
+    return pq.ParquetFile(path).metadata.num_rows
+
+
+STAGES = [
+    {"name": "filter_regions", "script": "filter_regions.py", "rows": "data/raw/eo_pa.csv"},
+    {"name": "classify_and_segment", "script": "classify_and_segment.py", "rows": "data/processed/allegheny_nonprofits.parquet"},
+    {"name": "flatten_financials", "script": "flatten_financials.py", "args": ["--full"], "rows": "data/financials_by_ein", "source": "json"},
+    {"name": "analyze_momentum", "script": "analyze_momentum.py", "rows": "data/processed/financial_timeseries.parquet"},
+    {"name": "build_trajectories", "script": "build_trajectories.py", "rows": "data/processed/financial_timeseries.parquet"},
+    {"name": "merge_and_score", "script": "merge_and_score.py", "rows": "data/processed/allegheny_mapped.parquet"},
+    {"name": "cluster_orgs", "script": "cluster_orgs.py", "args": ["--refit"], "rows": "data/processed/org_master_profiles.parquet"},
+    {"name": "score_targets", "script": "score_targets.py", "rows": "data/processed/org_master_profiles.parquet"},
+    {"name": "name_index", "script": "name_index.py", "rows": "data/processed/org_master_profiles_scored.parquet"},
+    {"name": "dashboard_filters", "script": "bench_pipeline.py", "args": ["--dashboard-worker"], "rows": "data/processed/org_master_profiles_scored.parquet"},
+]
+
+
+# === Synthetic workspace ===
+def generate_inputs(root, orgs, source, seed):
+    from synthetic import eins_for, make_bmf, make_timeseries, write_corpus
+
+    make_bmf(orgs, seed=seed).to_csv(root / "data/raw/eo_pa.csv", index=False)
+    eins = eins_for(orgs)
+    timeseries = make_timeseries(eins, seed=seed)
+    if source == "json":
+        write_corpus(timeseries, root / "data/financials_by_ein", eins=eins, seed=seed)
+    else:
+        timeseries.to_parquet(root / "timeseries.parquet", index=False)
+
+
+def prepare_workspace(root, orgs, source, seed):
+    # Inputs are generated once per (scale, source, seed) and reused; outputs are wiped each run.
+    # Generation runs in its own process: a child's peak RSS counts the parent's high-water
+    # mark at spawn, so this process has to stay small for the stage numbers to be honest.
+    marker = root / "inputs.json"
+    spec = {"orgs": orgs, "source": source, "seed": seed}
+    if not (marker.exists() and json.loads(marker.read_text()) == spec):
+        if root.exists():
+            shutil.rmtree(root)
+        (root / "data/raw").mkdir(parents=True)
+        print(f"🧪 Generating {orgs:,} synthetic orgs ({source}) in {root}")
+        worker = [sys.executable, __file__, "--generate-worker", str(root), "--orgs", str(orgs),
+                  "--source", source, "--seed", str(seed)]
+        subprocess.run(worker, check=True)
+        marker.write_text(json.dumps(spec))
+
+    for name in CONFIG_FILES:
+        shutil.copy(repo_root / name, root / name)
+    shutil.rmtree(root / "data/processed", ignore_errors=True)
+    (root / "data/processed").mkdir(parents=True)
+    if source == "timeseries":
+        shutil.copy(root / "timeseries.parquet", root / "data/processed/financial_timeseries.parquet")
+
+
+def run_benchmark(root, source, repeat=3):
+    # Best of `repeat` runs per stage; re-running a stage just rewrites the same outputs
+    results = {}
+    for stage in STAGES:
+        if stage.get("source", source) != source:
+            continue
+        spec = {"script": str(scripts_dir / stage["script"]), "args": stage.get("args", [])}
+        runs = []
+        for _ in range(repeat):
+            code, wall, peak_mb = run_stage(spec, cwd=root, stdout=subprocess.DEVNULL)
+            if code != 0:
+                raise SystemExit(f"❌ {stage['name']} exited with {code} (rerun it in {root} to see why)")
+            runs.append((wall, peak_mb))
+        wall = min(w for w, _ in runs)
+        peak_mb = min((p for _, p in runs if p is not None), default=None)
+        rows = stage_rows(root / stage["rows"])
+        results[stage["name"]] = {
+            "wall_s": round(wall, 3),
+            "peak_mb": round(peak_mb, 1) if peak_mb is not None else None,
+            "rows": rows,
+            "rows_per_s": round(rows / wall) if wall > 0 else None,
+        }
+        print(f"⏱️ {stage['name']:<22} {wall:8.2f}s  {results[stage['name']]['peak_mb'] or '-':>8} MB  {rows:>11,} rows")
+    return results
+
+
+# === Dashboard filter path ===
+def dashboard_worker(queries=200, seed=0):
+    # What a dashboard session does per data version and per rerun, without Streamlit:
+    # load + build the region's query service once, then random sidebar filter
+    # combinations with the chart rollup and the first table page
+    sys.path.append(str(repo_root / "app"))
+    from cubes import read_cube
+    from name_index import load_name_index
+    from query_service import RegionQuery
+    from schema import conform
+    from storage import map_snapshot, write_snapshot
+
+    snapshot = write_snapshot(
+        conform(pd.read_parquet("data/processed/org_master_profiles_scored.parquet"), compact=True),
+        "data/processed/org_master_profiles_scored.arrow",
+    )
+    query = RegionQuery(conform(map_snapshot(snapshot), compact=True), revenue_cap=200_000_000,
+                        cube=read_cube("data/processed/chart_cube.parquet"),
+                        names=load_name_index("data/processed/name_index.joblib"))
+
+    rng = np.random.default_rng(seed)
+    sectors = query.options("SECTOR")
+    for _ in range(queries):
+        picked = list(rng.choice(sectors, rng.integers(1, 4))) if rng.random() < 0.5 else None
+        filters = {
+            "revenue": tuple(sorted(rng.integers(0, 200, 2) * 1_000_000)),
+            "priority": query.score_bounds(),
+            "categories": {"SECTOR": picked, "TARGET_FLAG": None, "MOMENTUM_CLASS": None},
+            "zip_prefix": str(rng.integers(150, 160)) if rng.random() < 0.3 else "",
+        }
+        rows = query.match(filters)
+        query.flag_counts(filters, rows)
+        query.page(rows, 0, 50)
+
+
+# === Results and baseline ===
+def compare(results, baseline, tolerance):
+    # Stages more than `tolerance` (e.g. 0.25 = 25%) slower or bigger than the baseline
+    regressions = []
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        for metric in ("wall_s", "peak_mb"):
+            if now.get(metric) and before.get(metric) and now[metric] > before[metric] * (1 + tolerance):
+                regressions.append((name, metric, before[metric], now[metric]))
+    return regressions
+
+
+def print_comparison(results, baseline):
+    print("\n📊 Stage                     wall (s)   vs base    peak (MB)  vs base")
+    for name, now in results.items():
+        before = baseline.get(name, {})
+
+        def delta(metric):
+            if now.get(metric) and before.get(metric):
+                return f"{(now[metric] / before[metric] - 1) * 100:+6.0f}%"
+            return "      -"
+
+        print(f"   {name:<24} {now['wall_s']:8.2f}   {delta('wall_s')}   {now['peak_mb'] or '-':>9}  {delta('peak_mb')}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time every pipeline stage on synthetic data and compare to a baseline")
+    parser.add_argument("--orgs", type=int, nargs="+", default=[10_000], help="Scales to run, e.g. 10000 100000 1000000")
+    parser.add_argument("--source", choices=["json", "timeseries"], default="json",
+                        help="Start from a ProPublica JSON corpus (times flatten too) or a ready timeseries")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the fastest is kept")
+    parser.add_argument("--work-dir", type=Path, default=work_dir)
+    parser.add_argument("--results-dir", type=Path, default=results_dir)
+    parser.add_argument("--baseline", type=Path, default=baseline_file)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown / memory growth before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--dashboard-worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--generate-worker", type=Path, default=None, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    if opts.dashboard_worker:
+        dashboard_worker()
+        return
+    if opts.generate_worker:
+        generate_inputs(opts.generate_worker, opts.orgs[0], opts.source, opts.seed)
+        return
+
+    baseline = json.loads(opts.baseline.read_text()) if opts.baseline.exists() else {}
+    run = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "source": opts.source,
+        "scales": {},
+    }
+    regressions = []
+    for orgs in opts.orgs:
+        key = f"{orgs}-{opts.source}"
+        root = opts.work_dir / key
+        prepare_workspace(root, orgs, opts.source, opts.seed)
+        print(f"\n🏁 {orgs:,} orgs")
+        results = run_benchmark(root, opts.source, opts.repeat)
+        run["scales"][key] = results
+        if key in baseline.get("scales", {}):
+            print_comparison(results, baseline["scales"][key])
+            regressions += [(key, *r) for r in compare(results, baseline["scales"][key], opts.tolerance)]
+
+    opts.results_dir.mkdir(parents=True, exist_ok=True)
+    out = opts.results_dir / f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    out.write_text(json.dumps(run, indent=1))
+    print(f"\n💾 Results saved to {out}")
+
+    if opts.save_baseline:
+        # Keep other scales' baselines; replace the ones just measured
+        baseline = {**run, "scales": {**baseline.get("scales", {}), **run["scales"]}}
+        opts.baseline.parent.mkdir(parents=True, exist_ok=True)
+        opts.baseline.write_text(json.dumps(baseline, indent=1))
+        print(f"📌 Baseline updated: {opts.baseline}")
+
+    for key, name, metric, before, now in regressions:
+        print(f"⚠️ Regression at {key}: {name} {metric} {before} → {now}")
+    if regressions and opts.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
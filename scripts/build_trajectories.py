@@ -1,81 +1,105 @@
+import argparse
 import pandas as pd
 from pathlib import Path
 import numpy as np
 
+from perf import script_tracer
+from schema import conform
+from storage import incremental_eins, read_table, upsert_rows, write_table
+
 # === File paths ===
-input_file = Path("data/processed/financial_timeseries.csv")
-output_file = Path("data/processed/org_trajectories.csv")
-
-# === Load & filter ===
-df = pd.read_csv(input_file, dtype=str)
-df["YEAR"] = pd.to_numeric(df["YEAR"], errors="coerce")
-df["REVENUE"] = pd.to_numeric(df["REVENUE"], errors="coerce")
-df = df[df["YEAR"].between(2019, 2023)]
-
-# === Pivot: One row per org, one column per year ===
-pivot = df.pivot_table(index=["EIN", "ORG_NAME"], columns="YEAR", values="REVENUE")
-pivot.columns = [f"REV_{int(c)}" for c in pivot.columns]
-pivot.reset_index(inplace=True)
-
-# === Helper: Calculate CAGR ===
-def calc_cagr(row):
-    start = row.get("REV_2019")
-    end = row.get("REV_2023")
-    if pd.isna(start) or pd.isna(end) or start <= 0:
-        return np.nan
-    return ((end / start) ** (1 / 4)) - 1  # 4 years
-
-# === Apply metrics ===
-pivot["CAGR"] = pivot.apply(calc_cagr, axis=1)
-pivot["VOLATILITY"] = pivot[[f"REV_{y}" for y in range(2019, 2024)]].std(axis=1)
-
-# Count how many years increased or decreased
-def count_deltas(row):
-    up = down = 0
-    revs = [row.get(f"REV_{y}") for y in range(2019, 2024)]
-    for a, b in zip(revs, revs[1:]):
-        if pd.notna(a) and pd.notna(b):
-            if b > a:
-                up += 1
-            elif b < a:
-                down += 1
-    return up, down
-
-pivot["YEARS_UP"], pivot["YEARS_DOWN"] = zip(*pivot.apply(count_deltas, axis=1))
-
-# Peak / trough year
-def peak_year(row):
-    revs = {y: row.get(f"REV_{y}") for y in range(2019, 2024)}
-    revs = {y: v for y, v in revs.items() if pd.notna(v)}
-    return max(revs, key=revs.get) if revs else np.nan
-
-def trough_year(row):
-    revs = {y: row.get(f"REV_{y}") for y in range(2019, 2024)}
-    revs = {y: v for y, v in revs.items() if pd.notna(v)}
-    return min(revs, key=revs.get) if revs else np.nan
-
-pivot["PEAK_YEAR"] = pivot.apply(peak_year, axis=1)
-pivot["TROUGH_YEAR"] = pivot.apply(trough_year, axis=1)
-
-# Rebound rate: % change from trough to most recent
-def rebound_rate(row):
-    try:
-        trough = row[f"REV_{int(row['TROUGH_YEAR'])}"]
-        final = row.get("REV_2023")
-        if pd.isna(trough) or pd.isna(final) or trough <= 0:
-            return np.nan
-        return ((final - trough) / trough) * 100
-    except:
-        return np.nan
-
-pivot["REBOUND_RATE"] = pivot.apply(rebound_rate, axis=1)
-
-# Final formatting
-pivot["CAGR"] = (pivot["CAGR"] * 100).round(2)
-pivot["VOLATILITY"] = pivot["VOLATILITY"].round(0)
-pivot["REBOUND_RATE"] = pivot["REBOUND_RATE"].round(2)
-
-# Save
-pivot.to_csv(output_file, index=False)
-print(f"✅ Saved 5-year org trajectories to {output_file}")
-print(f"📈 Total orgs: {len(pivot)}")
\ No newline at end of file
+input_file = Path("data/processed/financial_timeseries.parquet")
+output_file = Path("data/processed/org_trajectories.parquet")
+
+
+def compute_trajectories(df, start_year=2019, end_year=2023):
+    years = list(range(start_year, end_year + 1))
+    rev_cols = [f"REV_{y}" for y in years]
+    df = df[df["YEAR"].between(start_year, end_year)]
+
+    # === Pivot: One row per org, one column per year ===
+    pivot = df.pivot_table(index=["EIN", "ORG_NAME"], columns="YEAR", values="REVENUE")
+    pivot = pivot.reindex(columns=years)
+    pivot.columns = rev_cols
+    pivot.reset_index(inplace=True)
+
+    revs = pivot[rev_cols].to_numpy(dtype=np.float64)
+    first, final = revs[:, 0], revs[:, -1]
+    rows = np.arange(len(revs))
+    missing = np.isnan(revs)
+    empty = missing.all(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # CAGR over the whole window, only when the starting year is positive
+        cagr = np.where(first > 0, (final / first) ** (1 / (len(years) - 1)) - 1, np.nan)
+
+        # Count how many years increased or decreased (NaN comparisons are False)
+        deltas = np.diff(revs, axis=1)
+
+        # Peak / trough year: first occurrence of the max / min among reported years
+        peak_idx = np.where(missing, -np.inf, revs).argmax(axis=1)
+        trough_idx = np.where(missing, np.inf, revs).argmin(axis=1)
+
+        # Rebound rate: % change from trough to most recent
+        trough = revs[rows, trough_idx]
+        rebound = np.where(trough > 0, (final - trough) / trough * 100, np.nan)
+
+    year_arr = np.array(years)
+    pivot["CAGR"] = cagr
+    pivot["VOLATILITY"] = pivot[rev_cols].std(axis=1)
+    pivot["YEARS_UP"] = (deltas > 0).sum(axis=1)
+    pivot["YEARS_DOWN"] = (deltas < 0).sum(axis=1)
+    pivot["PEAK_YEAR"] = pd.array(np.where(empty, 0, year_arr[peak_idx]), dtype="Int64")
+    pivot["TROUGH_YEAR"] = pd.array(np.where(empty, 0, year_arr[trough_idx]), dtype="Int64")
+    pivot.loc[empty, ["PEAK_YEAR", "TROUGH_YEAR"]] = pd.NA
+    pivot["REBOUND_RATE"] = rebound
+
+    # Final formatting
+    pivot["CAGR"] = (pivot["CAGR"] * 100).round(2)
+    pivot["VOLATILITY"] = pivot["VOLATILITY"].round(0)
+    pivot["REBOUND_RATE"] = pivot["REBOUND_RATE"].round(2)
+    return pivot
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build multi-year revenue trajectories per org")
+    parser.add_argument("--input", type=Path, default=input_file)
+    parser.add_argument("--output", type=Path, default=output_file)
+    parser.add_argument("--start-year", type=int, default=2019)
+    parser.add_argument("--end-year", type=int, default=2023)
+    parser.add_argument("--changed-eins", type=Path, help="Only recompute these EINs (one per line) and upsert them into --output")
+    opts = parser.parse_args(argv)
+    if opts.end_year <= opts.start_year:
+        parser.error("--end-year must be after --start-year")
+    return opts
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    tracer = script_tracer("build_trajectories", incremental=bool(opts.changed_eins))
+
+    eins, filters = incremental_eins(opts.changed_eins, opts.output)
+    if eins == []:
+        return
+
+    # === Load & filter ===
+    df = read_table(opts.input, columns=["EIN", "ORG_NAME", "YEAR", "REVENUE"], filters=filters)
+    tracer.mark("load", rows=len(df))
+    pivot = compute_trajectories(df, opts.start_year, opts.end_year)
+    tracer.mark("pivot", rows=len(pivot))
+
+    if eins is not None:
+        print(f"🔁 Recomputed {len(eins)} changed EINs")
+        pivot = upsert_rows(read_table(opts.output), conform(pivot), eins).sort_values("EIN", kind="stable")
+        tracer.mark("upsert", rows=len(pivot))
+
+    # Save
+    write_table(conform(pivot), opts.output)
+    tracer.mark("save", rows=len(pivot))
+    span = opts.end_year - opts.start_year + 1
+    print(f"✅ Saved {span}-year org trajectories to {opts.output}")
+    print(f"📈 Total orgs: {len(pivot)}")
+
+
+if __name__ == "__main__":
+    main()
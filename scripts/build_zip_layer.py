@@ -0,0 +1,119 @@
+import argparse
+import json
+from pathlib import Path
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+from perf import script_tracer
+from zip_map import LEVELS, layer_file
+
+# === File paths ===
+regions_file = Path("data/regions.json")
+summary_path = Path("data/processed/summary_by_zip.csv")
+output_dir = Path("data/processed")
+
+# === ZIP map layer ===
+# ZIP boundaries (Census ZCTAs, stored locally: "zcta" in data/regions.json) joined once
+# to the ZIP summary, simplified for a few zoom levels and written as GeoJSON the
+# dashboard hands straight to Plotly. Shapes are simplified as a coverage, so neighbouring
+# ZIPs keep sharing one border at every level (no gaps or overlaps). Tolerances are in
+# metres; coordinates are kept to 5 decimals (~1 m).
+ZOOM_LEVELS = dict(zip(LEVELS, [500, 100, 20]))
+METRIC_CRS = "EPSG:5070"  # CONUS Albers
+MAP_CRS = "EPSG:4326"
+EMPTY_LAYER = json.dumps({"type": "FeatureCollection", "features": []})
+
+
+def zip5(values):
+    # "15213-2654" / 15213 / "2138" -> "15213" / "15213" / "02138"
+    return pd.Series(values, dtype="string").str.strip().str[:5].str.zfill(5)
+
+
+def load_summary(path):
+    # One row per ZIP5 (the summary is grouped on the raw ZIP, which may carry a +4)
+    summary = pd.read_csv(path, dtype={"ZIP": str})
+    summary["ZIP"] = zip5(summary["ZIP"])
+    summary = summary.dropna(subset=["ZIP"]).sort_values("org_count", ascending=False, kind="stable")
+    return summary.groupby("ZIP").agg(
+        ORG_COUNT=("org_count", "sum"),
+        TOTAL_REVENUE=("total_revenue", "sum"),
+        DOMINANT_SECTOR=("dominant_sector", "first"),
+    ).reset_index()
+
+
+def load_boundaries(spec, zips):
+    # Only the ZCTAs we have orgs in, read straight from the (zipped) shapefile / GeoPackage.
+    # `zips` must be non-empty and all digits (see main)
+    quoted = ", ".join(f"'{z}'" for z in zips)
+    shapes = gpd.read_file(spec["path"], columns=[spec["zip"]], where=f"{spec['zip']} IN ({quoted})")
+    shapes = shapes.rename(columns={spec["zip"]: "ZIP"})
+    shapes["ZIP"] = zip5(shapes["ZIP"])
+    return shapes.dissolve("ZIP", as_index=False)
+
+
+def simplified(layer, tolerance):
+    out = layer.copy()
+    out["geometry"] = layer.geometry.simplify_coverage(tolerance)
+    out = out.to_crs(MAP_CRS)
+    out["geometry"] = out.geometry.set_precision(1e-5)
+    out = out[~out.geometry.is_empty]
+    out["VERTICES"] = shapely.get_num_coordinates(out.geometry.values)
+    return out
+
+
+def write_empty_layers(directory):
+    # So the dashboard just explains why there's no map
+    for level in LEVELS:
+        layer_file(directory, level).write_text(EMPTY_LAYER)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Join ZIP summaries to ZCTA boundaries and write simplified map layers")
+    parser.add_argument("--summary", type=Path, default=summary_path)
+    parser.add_argument("--regions", type=Path, default=regions_file, help="Config with the ZCTA boundary file (\"zcta\")")
+    parser.add_argument("--output-dir", type=Path, default=output_dir)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    tracer = script_tracer("build_zip_layer")
+
+    opts.output_dir.mkdir(parents=True, exist_ok=True)
+    with open(opts.regions, "r") as f:
+        spec = json.load(f).get("zcta")
+    if not spec or not Path(spec["path"]).exists():
+        write_empty_layers(opts.output_dir)
+        where = spec["path"] if spec else f"no \"zcta\" entry in {opts.regions}"
+        print(f"⚠️ No ZCTA boundary file ({where}); wrote empty ZIP map layers")
+        return
+
+    # === Join the summary to the boundaries ===
+    summary = load_summary(opts.summary)
+    zips = summary.loc[summary["ZIP"].str.fullmatch(r"\d{5}").fillna(False), "ZIP"]
+    if zips.empty:
+        write_empty_layers(opts.output_dir)
+        print(f"⚠️ No valid ZIPs in {opts.summary}; wrote empty ZIP map layers")
+        return
+    shapes = load_boundaries(spec, zips)
+    tracer.mark("load", rows=len(shapes))
+    layer = shapes.merge(summary, on="ZIP", how="inner").to_crs(METRIC_CRS)
+    unmapped = summary.loc[~summary["ZIP"].isin(layer["ZIP"]), "ORG_COUNT"].sum()
+    tracer.mark("join", rows=len(layer))
+    print(f"🗺️ Matched {len(layer):,} of {len(summary):,} ZIPs to boundaries ({unmapped:,} orgs in ZIPs without one, e.g. PO boxes)")
+
+    # === One simplified layer per zoom level ===
+    for level, tolerance in ZOOM_LEVELS.items():
+        out = simplified(layer, tolerance)
+        path = layer_file(opts.output_dir, level)
+        tmp = path.with_suffix(".geojson.tmp")
+        tmp.write_text(out.to_json(show_bbox=True, drop_id=True))
+        tmp.replace(path)
+        print(f"✅ {level} layer ({out['VERTICES'].sum():,} vertices) saved to {path}")
+        tracer.mark(f"{level} layer", rows=len(out))
+
+
+if __name__ == "__main__":
+    main()
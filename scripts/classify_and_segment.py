@@ -1,80 +1,101 @@
 import pandas as pd
+import numpy as np
 import json
 from pathlib import Path
 
+from perf import script_tracer
+from schema import conform
+from storage import read_table, write_table
+
 # === File paths ===
-input_file = Path("data/processed/allegheny_nonprofits.csv")
+input_file = Path("data/processed/allegheny_nonprofits.parquet")
 sector_map_file = Path("data/sector_map.json")
-mapped_output = Path("data/processed/allegheny_mapped.csv")
+mapped_output = Path("data/processed/allegheny_mapped.parquet")
 summary_by_sector = Path("data/processed/summary_by_sector.csv")
 summary_by_zip = Path("data/processed/summary_by_zip.csv")
 top_orgs_output = Path("data/processed/top_orgs_by_revenue.csv")
 
+tracer = script_tracer("classify_and_segment")
+
 # === Load data ===
-df = pd.read_csv(input_file, dtype=str)
+df = read_table(input_file, csv_dtype=str)
 with open(sector_map_file, "r") as f:
     sector_map = json.load(f)
+tracer.mark("load", rows=len(df))
 
 # === Clean and map NTEE sector ===
-def get_sector(ntee_code):
-    if not isinstance(ntee_code, str) or len(ntee_code.strip()) == 0:
-        return "Unknown"
-    prefix = ntee_code.strip().upper()[0]
-    return sector_map.get(prefix, "Unknown")
-
+# Sector comes from the first letter of the NTEE code; blank or unmapped codes are "Unknown"
 df["NTEE_CD"] = df["NTEE_CD"].fillna("").astype(str)
-df["SECTOR"] = df["NTEE_CD"].apply(get_sector)
+df["SECTOR"] = df["NTEE_CD"].str.strip().str.upper().str[0].map(sector_map).fillna("Unknown")
 
 # === Normalize numeric fields ===
-df["INCOME_AMT"] = pd.to_numeric(df["INCOME_AMT"], errors="coerce")
-df["ASSET_AMT"] = pd.to_numeric(df["ASSET_AMT"], errors="coerce")
-df["REVENUE_AMT"] = pd.to_numeric(df["REVENUE_AMT"], errors="coerce")
+def to_number(series):
+    # Plain numeric text parses much faster with astype; anything malformed falls back to coercion (-> NaN)
+    try:
+        return series.astype("float64")
+    except (TypeError, ValueError):
+        return pd.to_numeric(series, errors="coerce")
 
-# === Size bucket classification ===
-def size_bucket(rev):
-    if pd.isna(rev): return "Unknown"
-    if rev < 50000: return "Micro"
-    if rev < 250000: return "Small"
-    if rev < 1000000: return "Medium"
-    if rev < 10000000: return "Large"
-    return "Major"
+for col in ["INCOME_AMT", "ASSET_AMT", "REVENUE_AMT"]:
+    df[col] = to_number(df[col])
 
-df["SIZE_BUCKET"] = df["INCOME_AMT"].apply(size_bucket)
+# === Size bucket classification ===
+# Micro < $50K <= Small < $250K <= Medium < $1M <= Large < $10M <= Major; no income = Unknown
+size_edges = [-np.inf, 50_000, 250_000, 1_000_000, 10_000_000, np.inf]
+size_labels = ["Micro", "Small", "Medium", "Large", "Major"]
+df["SIZE_BUCKET"] = (
+    pd.cut(df["INCOME_AMT"], bins=size_edges, labels=size_labels, right=False)
+    .cat.add_categories("Unknown")
+    .fillna("Unknown")
+    .astype(str)
+)
+tracer.mark("classify", rows=len(df))
 
 # === Save mapped file ===
-df.to_csv(mapped_output, index=False)
+write_table(conform(df), mapped_output)
 print(f"✅ Saved mapped org file to {mapped_output}")
+tracer.mark("save mapped", rows=len(df))
 
-# === Summary by sector ===
-sector_summary = df.groupby("SECTOR").agg(
-    org_count = ("EIN", "count"),
-    total_revenue = ("INCOME_AMT", "sum"),
-    avg_revenue = ("INCOME_AMT", "mean")
-).round(2).reset_index()
+# === One grouped pass for every summary ===
+# Finest grain the summaries need; the sector and ZIP views are sums over it
+cells = df.groupby(["SECTOR", "ZIP", "SIZE_BUCKET"], dropna=False).agg(
+    org_count=("EIN", "count"),
+    rows=("EIN", "size"),
+    total_revenue=("INCOME_AMT", "sum"),
+    revenue_count=("INCOME_AMT", "count"),
+).reset_index()
+tracer.mark("group cells", rows=len(cells))
+
+
+def rollup(by):
+    out = cells.groupby(by)[["org_count", "total_revenue", "revenue_count"]].sum()
+    out["avg_revenue"] = out["total_revenue"] / out["revenue_count"]
+    return out[["org_count", "total_revenue", "avg_revenue"]].round(2).reset_index()
 
-size_counts = df.pivot_table(index="SECTOR", columns="SIZE_BUCKET", values="EIN", aggfunc="count", fill_value=0)
+
+# === Summary by sector ===
+sector_summary = rollup("SECTOR")
+size_counts = cells.pivot_table(index="SECTOR", columns="SIZE_BUCKET", values="org_count", aggfunc="sum", fill_value=0)
 sector_summary = sector_summary.merge(size_counts, on="SECTOR", how="left")
 sector_summary.to_csv(summary_by_sector, index=False)
 print(f"📊 Saved summary by sector to {summary_by_sector}")
 
 # === Summary by ZIP ===
-zip_summary = df.groupby("ZIP").agg(
-    org_count = ("EIN", "count"),
-    total_revenue = ("INCOME_AMT", "sum"),
-    avg_revenue = ("INCOME_AMT", "mean")
-).round(2).reset_index()
+zip_summary = rollup("ZIP")
 
 # Exclude "Unknown" sector from dominant logic
-dominant_sector = df[df["SECTOR"] != "Unknown"] \
-    .groupby(["ZIP", "SECTOR"]).size().reset_index(name="count")
+dominant_sector = cells[cells["SECTOR"] != "Unknown"] \
+    .groupby(["ZIP", "SECTOR"])["rows"].sum().reset_index(name="count")
 
 dominant = dominant_sector.sort_values("count", ascending=False).drop_duplicates("ZIP")
 zip_summary = zip_summary.merge(dominant[["ZIP", "SECTOR"]], on="ZIP", how="left")
 zip_summary.rename(columns={"SECTOR": "dominant_sector"}, inplace=True)
 zip_summary.to_csv(summary_by_zip, index=False)
 print(f"📌 Saved summary by ZIP to {summary_by_zip}")
+tracer.mark("summaries", rows=len(zip_summary))
 
 # === Top orgs by revenue ===
-top_orgs = df.sort_values("INCOME_AMT", ascending=False).head(100)
+top_orgs = df.nlargest(100, "INCOME_AMT")
 top_orgs[["EIN", "NAME", "SECTOR", "INCOME_AMT", "ASSET_AMT", "ZIP"]].to_csv(top_orgs_output, index=False)
-print(f"🏆 Saved top orgs by revenue to {top_orgs_output}")
\ No newline at end of file
+print(f"🏆 Saved top orgs by revenue to {top_orgs_output}")
+tracer.mark("top orgs", rows=len(top_orgs))
@@ -0,0 +1,178 @@
+import argparse
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.preprocessing import StandardScaler
+
+from perf import script_tracer
+from schema import conform, csv_dtypes
+from storage import read_table, write_table
+
+# === File paths ===
+profiles_path = Path("data/processed/org_master_profiles.parquet")
+trajectories_path = Path("data/processed/org_trajectories.parquet")
+output_file = Path("data/processed/org_clusters.parquet")
+model_file = Path("data/processed/cluster_model.joblib")
+summary_file = Path("data/processed/cluster_summary.csv")
+
+# === Clustering ===
+# MiniBatchKMeans over each org's size, program share, momentum and trajectory.
+# The model (with its scaler, fill values and clip bounds) is kept in model_file, and
+# the output keeps the feature values each org was clustered on. On a rerun, only orgs
+# that are new or whose features changed (refreshed filings) are fed to partial_fit and
+# re-assigned; everyone else keeps their CLUSTER_ID, so cluster numbers stay stable.
+# --refit starts over from the whole population.
+FEATURES = ["REVENUE", "PROGRAM_PCT", "MOMENTUM_SCORE", "VOLATILITY", "CAGR", "REBOUND_RATE"]
+LOG_FEATURES = ["REVENUE", "VOLATILITY"]  # dollar amounts, spread over orders of magnitude
+
+
+def load_features(profiles, trajectories):
+    # One row per org: revenue / program % / momentum from the profiles, the rest from trajectories
+    trajectories = trajectories.drop_duplicates("EIN").set_index("EIN")[["VOLATILITY", "CAGR", "REBOUND_RATE"]]
+    df = profiles[["EIN", "REVENUE", "PROGRAM_PCT", "MOMENTUM_SCORE"]].drop_duplicates("EIN")
+    df = df.join(trajectories, on="EIN", how="left")
+    return df[["EIN"] + FEATURES].reset_index(drop=True)
+
+
+def _transform(values):
+    values = values.astype(np.float64)
+    for i, col in enumerate(FEATURES):
+        if col in LOG_FEATURES:
+            values[:, i] = np.sign(values[:, i]) * np.log1p(np.abs(values[:, i]))
+    return values
+
+
+def fit_preprocessing(values):
+    # Missing values are filled with the median; ratios like CAGR have extreme tails,
+    # so every feature is clipped to its 1st-99th percentile before scaling
+    values = _transform(values)
+    fill = np.nan_to_num(np.nanmedian(values, axis=0)) if len(values) else np.zeros(len(FEATURES))
+    values = np.where(np.isnan(values), fill, values)
+    low, high = np.percentile(values, [1, 99], axis=0) if len(values) else (fill, fill)
+    scaler = StandardScaler().fit(np.clip(values, low, high))
+    return {"fill": fill, "low": low, "high": high, "scaler": scaler}
+
+
+def prepare(values, prep):
+    values = _transform(values)
+    values = np.where(np.isnan(values), prep["fill"], values)
+    return prep["scaler"].transform(np.clip(values, prep["low"], prep["high"]))
+
+
+def _batches(n, batch_size, rng):
+    order = rng.permutation(n)
+    return [order[i:i + batch_size] for i in range(0, n, batch_size)]
+
+
+def fit_model(X, clusters, batch_size, epochs, seed=0):
+    # partial_fit over shuffled batches, a few passes over the population
+    model = MiniBatchKMeans(n_clusters=clusters, batch_size=batch_size, random_state=seed, n_init=3)
+    rng = np.random.default_rng(seed)
+    for _ in range(epochs):
+        for batch in _batches(len(X), batch_size, rng):
+            # The first batch seeds the centers, so it needs at least one row per cluster
+            if not hasattr(model, "cluster_centers_") and len(batch) < clusters:
+                batch = np.arange(len(X))
+            model.partial_fit(X[batch])
+    return model
+
+
+def update_model(model, X, batch_size, seed=0):
+    # One pass of the new / changed orgs through partial_fit
+    rng = np.random.default_rng(seed)
+    for batch in _batches(len(X), batch_size, rng):
+        model.partial_fit(X[batch])
+    return model
+
+
+def changed_rows(features, previous):
+    # Positions in `features` of orgs that are new or whose feature values differ
+    merged = features[["EIN"]].merge(previous, on="EIN", how="left")
+    same = merged["CLUSTER_ID"].notna().to_numpy(copy=True)
+    for col in FEATURES:
+        a = features[col].to_numpy(dtype=np.float64)
+        b = merged[col].to_numpy(dtype=np.float64)
+        same &= (a == b) | (np.isnan(a) & np.isnan(b))
+    return np.flatnonzero(~same)
+
+
+def cluster_summary(clustered):
+    summary = clustered.groupby("CLUSTER_ID")[FEATURES].median().round(2)
+    summary.insert(0, "ORG_COUNT", clustered.groupby("CLUSTER_ID").size())
+    return summary.reset_index()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cluster orgs on size, momentum and trajectory features")
+    parser.add_argument("--profiles", type=Path, default=profiles_path)
+    parser.add_argument("--trajectories", type=Path, default=trajectories_path)
+    parser.add_argument("--output", type=Path, default=output_file)
+    parser.add_argument("--model", type=Path, default=model_file, help="Fitted scaler + MiniBatchKMeans (joblib)")
+    parser.add_argument("--summary", type=Path, default=summary_file)
+    parser.add_argument("--clusters", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--epochs", type=int, default=5, help="Passes over the population for a full fit")
+    parser.add_argument("--refit", action="store_true", help="Fit from scratch instead of updating the saved model")
+    opts = parser.parse_args(argv)
+    if opts.clusters < 1 or opts.batch_size < 1 or opts.epochs < 1:
+        parser.error("--clusters, --batch-size and --epochs must be positive")
+    return opts
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    tracer = script_tracer("cluster_orgs")
+
+    # === Load data ===
+    profiles = conform(read_table(opts.profiles, columns=["EIN", "REVENUE", "PROGRAM_PCT", "MOMENTUM_SCORE"],
+                                  csv_dtype=csv_dtypes()))
+    trajectories = conform(read_table(opts.trajectories, columns=["EIN", "VOLATILITY", "CAGR", "REBOUND_RATE"],
+                                      csv_dtype=csv_dtypes()))
+    features = load_features(profiles, trajectories)
+    if features.empty:
+        raise SystemExit("❌ No orgs to cluster")
+    values = features[FEATURES].to_numpy(dtype=np.float64)
+    tracer.mark("load", rows=len(features))
+
+    # === Full fit or incremental update ===
+    saved = joblib.load(opts.model) if opts.model.exists() and opts.output.exists() and not opts.refit else None
+    if saved is not None and (saved["features"] != FEATURES or saved["clusters"] != opts.clusters):
+        saved = None
+
+    if saved is None:
+        clusters = min(opts.clusters, len(features))
+        prep = fit_preprocessing(values)
+        X = prepare(values, prep)
+        model = fit_model(X, clusters, max(opts.batch_size, clusters), opts.epochs)
+        features["CLUSTER_ID"] = model.predict(X)
+        print(f"🧩 Fitted {clusters} clusters on {len(features):,} orgs")
+        tracer.mark("fit", rows=len(features))
+    else:
+        prep, model = saved["prep"], saved["model"]
+        previous = read_table(opts.output)
+        rows = changed_rows(features, previous)
+        ids = features[["EIN"]].merge(previous[["EIN", "CLUSTER_ID"]], on="EIN", how="left")["CLUSTER_ID"]
+        if len(rows):
+            X = prepare(values[rows], prep)
+            update_model(model, X, opts.batch_size)
+            ids.iloc[rows] = model.predict(X)
+        features["CLUSTER_ID"] = ids.to_numpy()
+        print(f"🧩 Updated clusters with {len(rows):,} new or changed orgs (of {len(features):,})")
+        tracer.mark("update", rows=len(rows))
+
+    # === Save ===
+    opts.model.parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump({"features": FEATURES, "clusters": opts.clusters, "prep": prep, "model": model}, opts.model)
+    write_table(conform(features), opts.output)
+    print(f"✅ Saved cluster assignments to {opts.output} (model: {opts.model})")
+    tracer.mark("save", rows=len(features))
+
+    cluster_summary(features).to_csv(opts.summary, index=False)
+    print(f"📊 Cluster summary saved to {opts.summary}")
+    tracer.mark("summary", rows=len(features))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from storage import read_table
+
+cube_file = Path("data/processed/chart_cube.parquet")
+momentum_cube_file = Path("data/processed/momentum_cube.parquet")
+
+# === Chart cube ===
+# Counts and sums over the dashboard's filter/chart dimensions, one row per populated
+# combination. Revenue is banded at the dashboard slider's step (REVENUE_BAND_WIDTH)
+# up to its max; REVENUE_ON_EDGE marks orgs sitting exactly on a band's lower edge so
+# an inclusive slider range [a, b] (in whole steps) can be answered exactly.
+REVENUE_BAND_WIDTH = 1_000_000
+REVENUE_BANDS = 200
+
+DIMENSIONS = [
+    "SECTOR", "TARGET_FLAG", "MOMENTUM_CLASS", "SIZE_BUCKET", "ZIP3",
+    "PRIORITY_SCORE", "REVENUE_BAND", "REVENUE_ON_EDGE",
+]
+MEASURES = ["ORG_COUNT", "REVENUE_SUM"]
+
+
+def build_cube(df, band_width=REVENUE_BAND_WIDTH, bands=REVENUE_BANDS):
+    revenue = pd.to_numeric(df["REVENUE"], errors="coerce")
+    band = np.floor(revenue / band_width).clip(lower=-1, upper=bands)
+    on_edge = (band >= 0) & (revenue == np.minimum(band, bands) * band_width)
+
+    keys = pd.DataFrame({
+        "SECTOR": df["SECTOR"],
+        "TARGET_FLAG": df["TARGET_FLAG"],
+        "MOMENTUM_CLASS": df["MOMENTUM_CLASS"],
+        "SIZE_BUCKET": df["SIZE_BUCKET"],
+        "ZIP3": df["ZIP"].astype("string").str[:3],
+        "PRIORITY_SCORE": df["PRIORITY_SCORE"],
+        "REVENUE_BAND": band,
+        "REVENUE_ON_EDGE": on_edge,
+        "REVENUE": revenue,
+    })
+    cube = keys.groupby(DIMENSIONS, dropna=False, observed=True).agg(
+        ORG_COUNT=("REVENUE_ON_EDGE", "size"),
+        REVENUE_SUM=("REVENUE", "sum"),
+    )
+    return cube.reset_index()
+
+
+def build_momentum_cube(df):
+    # Momentum chart: clipped (−0.5..1.5) score sums/counts by sector and class,
+    # orgs with a known sector only. Unfiltered, so it is a separate small cube.
+    known = df[df["SECTOR"].notna() & (df["SECTOR"] != "Unknown")]
+    momentum = pd.to_numeric(known["MOMENTUM_SCORE"], errors="coerce").clip(lower=-0.5, upper=1.5)
+    cube = momentum.groupby([known["SECTOR"], known["MOMENTUM_CLASS"]], observed=True).agg(["sum", "count"])
+    cube.columns = ["MOMENTUM_SUM", "MOMENTUM_COUNT"]
+    return cube.reset_index()
+
+
+def read_cube(path=cube_file):
+    return read_table(path)
+
+
+def can_answer(revenue_range=None, zip_prefix="", band_width=REVENUE_BAND_WIDTH, bands=REVENUE_BANDS):
+    # The cube is exact only for whole-band revenue ranges and ZIP prefixes up to 3 digits
+    if zip_prefix and len(zip_prefix) > 3:
+        return False
+    if revenue_range is not None:
+        low, high = revenue_range
+        for bound in (low, high):
+            if bound < 0 or bound > bands * band_width or bound % band_width:
+                return False
+    return True
+
+
+def cube_mask(cube, revenue_range=None, priority_range=None, categories=None, zip_prefix="",
+              band_width=REVENUE_BAND_WIDTH):
+    # Row mask over the cube for the dashboard filters (None selection = any non-null value)
+    mask = np.ones(len(cube), dtype=bool)
+    if revenue_range is not None:
+        a, b = (int(bound // band_width) for bound in revenue_range)
+        band = cube["REVENUE_BAND"]
+        mask &= ((band >= a) & (band < b)) | ((band == b) & cube["REVENUE_ON_EDGE"])
+    if priority_range is not None:
+        mask &= cube["PRIORITY_SCORE"].between(*priority_range)
+    for col, selected in (categories or {}).items():
+        mask &= cube[col].isin(selected) if selected is not None else cube[col].notna()
+    if zip_prefix:
+        mask &= cube["ZIP3"].str.startswith(zip_prefix).fillna(False)
+    return np.asarray(mask, dtype=bool)
+
+
+def rollup(cube, by, mask=None):
+    # Sum the measures of the selected cube rows up to the `by` dimensions
+    if mask is not None:
+        cube = cube[mask]
+    return cube.groupby(by, observed=True)[MEASURES].sum().reset_index()
@@ -1,37 +1,381 @@
-import pandas as pd
-import requests
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-import json
 
-# Load EINs
-df = pd.read_csv("data/processed/allegheny_mapped.csv", dtype=str)
-eins = df["EIN"].dropna().unique().tolist()
+import requests
+from requests.adapters import HTTPAdapter
+
+from perf import script_tracer
+from storage import read_table
 
+# === Defaults ===
+input_file = Path("data/processed/allegheny_mapped.parquet")
 output_dir = Path("data/financials_by_ein")
-output_dir.mkdir(parents=True, exist_ok=True)
+manifest_file = Path("data/processed/fetch_manifest.json")
+changes_file = Path("data/processed/changed_eins.txt")
 
 # API endpoint template
 base_url = "https://projects.propublica.org/nonprofits/api/v2/organizations/{}.json"
 
-for idx, ein in enumerate(eins):
-    out_path = output_dir / f"{ein}.json"
+RETRYABLE = {429, 500, 502, 503, 504}
 
-    # Skip if already downloaded
-    if out_path.exists():
-        print(f"[{idx+1}/{len(eins)}] Skipping {ein} (already cached)")
-        continue
 
-    url = base_url.format(ein)
-    try:
-        response = requests.get(url, timeout=10)
-        if response.status_code == 200:
-            with open(out_path, "w") as f:
-                json.dump(response.json(), f)
-            print(f"[{idx+1}/{len(eins)}] ✅ Saved {ein}")
+# === Token bucket rate limiter ===
+class TokenBucket:
+    # Refills `rate` tokens per second up to `burst`; acquire() blocks until one is free.
+    # A rate of 0 (or less) disables throttling.
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst if burst else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# === Persistent fetch manifest ===
+class FetchManifest:
+    # Maps EIN -> {"status": "done" | "failed" | "not_found", ...} and survives reruns.
+    def __init__(self, path, flush_every=200):
+        self.path = Path(path)
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.dirty = 0
+        self.entries = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+
+    def get(self, ein):
+        return self.entries.get(ein, {})
+
+    def status(self, ein):
+        return self.entries.get(ein, {}).get("status")
+
+    def record(self, ein, **fields):
+        with self.lock:
+            entry = self.entries.setdefault(ein, {})
+            entry.pop("error", None)
+            entry.update(fields)
+            self.dirty += 1
+            if self.dirty >= self.flush_every:
+                self._write()
+
+    def save(self):
+        with self.lock:
+            self._write()
+
+    def _write(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.entries, f, indent=0, sort_keys=True)
+        os.replace(tmp, self.path)
+        self.dirty = 0
+
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def write_atomic(path, content):
+    # Write to a temp file first so an interrupted run never leaves a truncated JSON "cached"
+    tmp = path.with_suffix(".part")
+    with open(tmp, "wb") as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+# === HTTP ===
+_local = threading.local()
+
+
+def get_session(pool_size):
+    # One keep-alive session per worker thread
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return session
+
+
+def backoff_delay(attempt, backoff, retry_after=None):
+    delay = backoff * (2 ** attempt) + random.uniform(0, backoff)
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass
+    return delay
+
+
+def request_with_retry(session, url, bucket, retries, backoff, timeout, headers=None):
+    # Returns the final response, or raises the last network error once retries run out
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        retry_after = None
+        try:
+            response = session.get(url, timeout=timeout, headers=headers)
+        except requests.RequestException:
+            if attempt == retries:
+                raise
         else:
-            print(f"[{idx+1}/{len(eins)}] ❌ Error {response.status_code} for {ein}")
-    except Exception as e:
-        print(f"[{idx+1}/{len(eins)}] ⚠️ Exception for {ein}: {e}")
+            if response.status_code not in RETRYABLE or attempt == retries:
+                return response
+            retry_after = response.headers.get("Retry-After")
+        time.sleep(backoff_delay(attempt, backoff, retry_after))
+
+
+def file_digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def latest_tax_year(content):
+    # Latest tax_prd_yr among filings with data, used to decide when a new filing is due
+    try:
+        data = json.loads(content)
+    except ValueError:
+        return None
+    years = [f.get("tax_prd_yr") for f in data.get("filings_with_data", []) if f.get("tax_prd_yr")]
+    return int(max(years)) if years else None
+
+
+def conditional_headers(previous):
+    headers = {}
+    if previous.get("etag"):
+        headers["If-None-Match"] = previous["etag"]
+    if previous.get("last_modified"):
+        headers["If-Modified-Since"] = previous["last_modified"]
+    return headers
+
+
+def fetch_ein(ein, out_dir, bucket, opts, previous=None):
+    # Returns (ein, manifest fields, changed) where `changed` means the cached JSON was (re)written
+    out_path = out_dir / f"{ein}.json"
+    # The ETag / digest describe the cached copy; without it, fetch (and count as changed) afresh
+    previous = previous if previous and out_path.exists() else {}
+    session = get_session(opts.workers)
+    url = opts.base_url.format(ein)
+    try:
+        response = request_with_retry(
+            session, url, bucket, opts.retries, opts.backoff, opts.timeout,
+            headers=conditional_headers(previous),
+        )
+    except requests.RequestException as e:
+        return ein, {"status": "failed", "error": str(e)}, False
+
+    if response.status_code == 304:
+        return ein, {"status": "done", "http_status": 304}, False
+    if response.status_code == 404:
+        # Gone upstream: drop the cached copy too, so the org's old filings don't linger
+        # (and pending_eins doesn't mark it "done" again next run)
+        removed = out_path.exists()
+        if removed:
+            out_path.unlink()
+        return ein, {"status": "not_found", "http_status": 404, "sha256": None, "etag": None, "last_modified": None}, removed
+    if response.status_code != 200:
+        return ein, {"status": "failed", "http_status": response.status_code}, False
+
+    content = response.content
+    digest = file_digest(content)
+    old_digest = previous.get("sha256")
+    if old_digest is None and out_path.exists():
+        old_digest = file_digest(out_path.read_bytes())
+
+    changed = digest != old_digest
+    if changed:
+        write_atomic(out_path, content)
+    return ein, {
+        "status": "done",
+        "http_status": 200,
+        "sha256": digest,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "latest_tax_yr": latest_tax_year(content),
+    }, changed
+
+
+def cached_eins(out_dir):
+    # One directory listing instead of an exists() call per EIN
+    return {entry.name[:-5] for entry in os.scandir(out_dir) if entry.name.endswith(".json")}
+
+
+def pending_eins(eins, out_dir, manifest):
+    cached = cached_eins(out_dir)
+    pending = []
+    for ein in eins:
+        if ein in cached:
+            if manifest.status(ein) != "done":
+                manifest.record(ein, status="done")
+            continue
+        if manifest.status(ein) == "not_found":
+            continue
+        pending.append(ein)
+    return pending
+
+
+# === Refresh selection ===
+def is_stale(entry, ttl_days, now):
+    fetched_at = entry.get("fetched_at")
+    if not fetched_at:
+        return True
+    return now - datetime.fromisoformat(fetched_at) >= timedelta(days=ttl_days)
+
+
+def filing_due(latest_year, lag_months, now):
+    # A filing for tax year Y+1 is expected roughly `lag_months` after that year closes
+    if latest_year is None:
+        return True
+    due_month = (latest_year + 2) * 12 + lag_months
+    return now.year * 12 + now.month - 1 >= due_month
+
+
+def refresh_candidates(eins, out_dir, manifest, opts):
+    # "done" EINs whose JSON is missing are left to pending_eins (fetched as new)
+    now = datetime.now(timezone.utc)
+    cached = cached_eins(out_dir)
+    candidates = []
+    for ein in eins:
+        entry = manifest.get(ein)
+        if entry.get("status") not in ("done", "not_found"):
+            continue
+        if entry.get("status") == "done" and ein not in cached:
+            continue
+        if not is_stale(entry, opts.ttl_days, now):
+            continue
+        if opts.due_only:
+            if entry.get("status") != "done":
+                continue
+            if "latest_tax_yr" not in entry:
+                # Legacy cache entry: read the year once and keep it in the manifest
+                year = latest_tax_year((out_dir / f"{ein}.json").read_bytes())
+                manifest.record(ein, latest_tax_yr=year)
+                entry = manifest.get(ein)
+            if not filing_due(entry.get("latest_tax_yr"), opts.filing_lag_months, now):
+                continue
+        candidates.append(ein)
+    return candidates
+
+
+def run_fetch(eins, out_dir, manifest, opts):
+    bucket = TokenBucket(opts.rate, opts.burst)
+    counts = {"done": 0, "failed": 0, "not_found": 0}
+    changed = []
+    total = len(eins)
+
+    with ThreadPoolExecutor(max_workers=opts.workers) as pool:
+        futures = [
+            pool.submit(fetch_ein, ein, out_dir, bucket, opts, manifest.get(ein)) for ein in eins
+        ]
+        for idx, future in enumerate(as_completed(futures), start=1):
+            ein, result, was_changed = future.result()
+            if was_changed:
+                result["changed_at"] = utc_now()
+                changed.append(ein)
+            if result["status"] != "failed":
+                result["fetched_at"] = utc_now()
+            manifest.record(ein, **result)
+            counts[result["status"]] += 1
+            if result["status"] == "failed":
+                print(f"[{idx}/{total}] ❌ {ein}: {result.get('http_status') or result.get('error')}")
+            elif idx % opts.progress_every == 0 or idx == total:
+                print(f"[{idx}/{total}] ✅ {counts['done']} ok ({len(changed)} changed), {counts['not_found']} not found, {counts['failed']} failed")
+
+    manifest.save()
+    return counts, sorted(changed)
+
+
+def write_changes(path, changed):
+    # One EIN per line so downstream stages can recompute just these orgs. Added to what's
+    # already listed: the list is only emptied once run_pipeline.py has used it everywhere,
+    # so fetching twice before a pipeline run doesn't lose the first run's changes
+    path.parent.mkdir(parents=True, exist_ok=True)
+    listed = set(path.read_text().split()) if path.exists() else set()
+    merged = sorted(listed | set(changed))
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        f.writelines(f"{ein}\n" for ein in merged)
+    os.replace(tmp, path)
+    return len(merged)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch ProPublica 990 financials for every EIN")
+    parser.add_argument("--input", type=Path, default=input_file)
+    parser.add_argument("--output-dir", type=Path, default=output_dir)
+    parser.add_argument("--manifest", type=Path, default=manifest_file)
+    parser.add_argument("--changes-out", type=Path, default=changes_file, help="Where to list EINs whose JSON changed")
+    parser.add_argument("--base-url", default=base_url, help="URL template with {} for the EIN")
+    parser.add_argument("--rate", type=float, default=4.0, help="Requests per second (0 = unlimited)")
+    parser.add_argument("--burst", type=float, default=None, help="Token bucket capacity")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--backoff", type=float, default=1.0, help="Base delay in seconds for exponential backoff")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--progress-every", type=int, default=100)
+
+    refresh = parser.add_argument_group("refresh")
+    refresh.add_argument("--refresh", action="store_true", help="Conditionally re-fetch already cached EINs")
+    refresh.add_argument("--ttl-days", type=float, default=30.0, help="Only refresh entries fetched at least this long ago")
+    refresh.add_argument("--due-only", action="store_true", help="Only refresh EINs whose next filing should be out by now")
+    refresh.add_argument("--filing-lag-months", type=int, default=18, help="Months after a tax year closes before its filing is expected")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    tracer = script_tracer("fetch_990_financials")
+    opts.output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Load EINs (stored as integers; ProPublica and the cache use the 9-digit form)
+    df = read_table(opts.input, columns=["EIN"], csv_dtype=str)
+    eins = df["EIN"].dropna().astype(str).str.zfill(9).unique().tolist()
+
+    manifest = FetchManifest(opts.manifest)
+    todo = pending_eins(eins, opts.output_dir, manifest)
+    print(f"📥 {len(eins)} EINs, {len(eins) - len(todo)} already cached or not found, {len(todo)} to fetch")
+
+    if opts.refresh:
+        stale = refresh_candidates(eins, opts.output_dir, manifest, opts)
+        print(f"🔄 Refreshing {len(stale)} cached EINs (ttl={opts.ttl_days}d{', due filings only' if opts.due_only else ''})")
+        todo = list(dict.fromkeys(todo + stale))
+    tracer.mark("plan", rows=len(eins))
+
+    changed = []
+    if todo:
+        counts, changed = run_fetch(todo, opts.output_dir, manifest, opts)
+        print(f"✅ OK {counts['done']} | 🔍 Not found {counts['not_found']} | ❌ Failed {counts['failed']}")
+    else:
+        manifest.save()
+    tracer.mark("fetch", rows=len(todo))
+
+    listed = write_changes(opts.changes_out, changed)
+    print(f"🆕 {len(changed)} EINs changed; {listed} listed in {opts.changes_out} for the next pipeline run")
+    print(f"🗂️ Manifest written to {opts.manifest}")
+
 
-    time.sleep(1)  # Respectful to the API (throttles ~1/sec)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import json
+from glob import glob
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+from perf import script_tracer
+from storage import TableWriter
+
+regions_file = Path("data/regions.json")
+
+# === Region definitions (see data/regions.json) ===
+# Each region keeps orgs in one of its `states` (any state if omitted) that match ANY of:
+#   cities        CITY in the set (upper-cased, trimmed)
+#   zip_prefixes  ZIP starts with one of the prefixes
+#   counties      ZIP maps to one of these county FIPS codes in the ZIP→county crosswalk
+# A region with none of the three keeps the whole state(s).
+
+
+def load_config(path=regions_file):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def load_crosswalk(spec, counties):
+    # county FIPS -> set of ZIP5s, from a crosswalk CSV (e.g. HUD's ZIP-COUNTY file)
+    xw = pd.read_csv(spec["path"], dtype=str, usecols=[spec["zip"], spec["fips"]])
+    xw = xw[xw[spec["fips"]].isin(counties)]
+    zips = xw[spec["zip"]].str.zfill(5)
+    return {fips: set(group) for fips, group in zips.groupby(xw[spec["fips"]])}
+
+
+def compile_regions(config):
+    counties = {fips for region in config["regions"].values() for fips in region.get("counties", [])}
+    county_zips = load_crosswalk(config["crosswalk"], counties) if counties else {}
+
+    regions = {}
+    for name, region in config["regions"].items():
+        zips = set()
+        for fips in region.get("counties", []):
+            zips |= county_zips.get(fips, set())
+        regions[name] = {
+            "output": Path(region["output"]),
+            "states": {s.upper() for s in region.get("states", [])},
+            "cities": {c.upper() for c in region.get("cities", [])},
+            "zip_prefixes": tuple(region.get("zip_prefixes", [])),
+            "zips": zips,
+        }
+    return regions
+
+
+def normalize(chunk):
+    chunk["CITY"] = chunk["CITY"].str.upper().str.strip()
+    chunk["STATE"] = chunk["STATE"].str.upper().str.strip()
+    chunk["ZIP"] = chunk["ZIP"].str[:5]
+    return chunk
+
+
+def region_mask(chunk, region):
+    mask = pd.Series(True, index=chunk.index)
+    if region["states"]:
+        mask &= chunk["STATE"].isin(region["states"])
+
+    local = pd.Series(False, index=chunk.index)
+    if region["cities"]:
+        local |= chunk["CITY"].isin(region["cities"])
+    if region["zip_prefixes"]:
+        local |= chunk["ZIP"].str.startswith(region["zip_prefixes"]).fillna(False)
+    if region["zips"]:
+        local |= chunk["ZIP"].isin(region["zips"])
+    if region["cities"] or region["zip_prefixes"] or region["zips"]:
+        mask &= local
+    return mask.to_numpy(dtype=bool)
+
+
+def input_files(patterns):
+    files = []
+    for pattern in patterns:
+        matched = sorted(glob(pattern))
+        files.extend(matched if matched else [pattern])
+    return list(dict.fromkeys(files))
+
+
+def filter_regions(files, regions, columns, chunksize=200_000):
+    # One pass over every input; each chunk is routed to every region it matches and
+    # appended to that region's output, so memory is bounded by the chunk size. Inputs
+    # must not overlap (the four regional BMF files don't; don't mix them with state files).
+    # Outputs are only swapped in once every input has been read; on any error the
+    # previous tables stay as they were. A region that matched nothing keeps its old one.
+    schema = pa.schema([(col, pa.string()) for col in columns])
+    writers = {name: TableWriter(region["output"], schema) for name, region in regions.items()}
+    scanned = 0
+    try:
+        for path in files:
+            print(f"📥 Streaming {path}")
+            for chunk in pd.read_csv(path, dtype=str, usecols=lambda c: c in columns, chunksize=chunksize):
+                chunk = normalize(chunk.reindex(columns=columns))
+                scanned += len(chunk)
+                for name, region in regions.items():
+                    matched = chunk[region_mask(chunk, region)]
+                    if len(matched):
+                        writers[name].write(matched)
+    except BaseException:
+        for writer in writers.values():
+            writer.close(keep=False)
+        raise
+    for writer in writers.values():
+        writer.close(keep=writer.rows > 0)
+    return scanned, {name: writer.rows for name, writer in writers.items()}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Filter the IRS EO master file(s) into per-region org lists")
+    parser.add_argument("--config", type=Path, default=regions_file)
+    parser.add_argument("--input", nargs="+", default=None, help="EO BMF CSVs or globs (default: the config's inputs)")
+    parser.add_argument("--regions", nargs="+", default=None, help="Only build these regions")
+    parser.add_argument("--chunksize", type=int, default=200_000, help="Rows read per chunk")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    tracer = script_tracer("filter_regions")
+    config = load_config(opts.config)
+    if opts.regions:
+        unknown = set(opts.regions) - set(config["regions"])
+        if unknown:
+            raise SystemExit(f"❌ Unknown region(s): {', '.join(sorted(unknown))}")
+        config["regions"] = {name: config["regions"][name] for name in opts.regions}
+
+    files = input_files(opts.input or config["inputs"])
+    missing = [f for f in files if not Path(f).exists()]
+    if missing:
+        print(f"❌ ERROR: Input not found — {', '.join(missing)}")
+        raise SystemExit(1)
+
+    regions = compile_regions(config)
+    print(f"🔍 Filtering {len(files)} file(s) into {len(regions)} region(s)...")
+    scanned, counts = filter_regions(files, regions, config["columns"], opts.chunksize)
+    print(f"✅ Scanned {scanned} rows")
+    tracer.mark("filter", rows=scanned)
+
+    for name, rows in counts.items():
+        if rows:
+            print(f"💾 {name}: {rows} nonprofits saved to {regions[name]['output']}")
+    # Most likely a malformed input or region definition, so fail rather than let
+    # downstream stages run on the previous (or no) org list
+    empty = [name for name, rows in counts.items() if rows == 0]
+    if empty:
+        print(f"❌ ERROR: {', '.join(empty)} matched no orgs; previous output left as is. Double-check data format and data/regions.json.")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,63 +1,240 @@
+import argparse
+import hashlib
 import json
-import pandas as pd
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from perf import script_tracer
+from storage import export_csv
+
 input_dir = Path("data/financials_by_ein")
-output_file = Path("data/processed/financial_timeseries.csv")
-output_file.parent.mkdir(parents=True, exist_ok=True)
+output_file = Path("data/processed/financial_timeseries.parquet")
+csv_export = Path("data/processed/financial_timeseries.csv")
+manifest_file = Path("data/processed/flatten_manifest.json")
+
+# ProPublica filing field -> output column
+NUMERIC_FIELDS = {
+    "REVENUE": "totrevenue",
+    "EXPENSES": "totfuncexpns",
+    "ASSETS": "totassetsend",
+    "PROGRAM_REVENUE": "totprgmrevnue",
+    "CONTRIBUTIONS": "totcntrbgfts",
+}
 
-records = []
+SCHEMA = pa.schema([
+    ("EIN", pa.int64()),
+    ("ORG_NAME", pa.string()),
+    ("YEAR", pa.int32()),
+    ("REVENUE", pa.float64()),
+    ("EXPENSES", pa.float64()),
+    ("ASSETS", pa.float64()),
+    ("PROGRAM_REVENUE", pa.float64()),
+    ("CONTRIBUTIONS", pa.float64()),
+    ("PROGRAM_PCT", pa.float64()),
+])
 
-for file in input_dir.glob("*.json"):
-    ein = file.stem
+
+def to_number(value):
+    if value in (None, "", "null"):
+        return None
     try:
-        with open(file, "r") as f:
-            data = json.load(f)
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_year(value):
+    number = to_number(value)
+    return int(number) if number is not None else None
+
+
+# === Worker: parse a batch of files into typed columns ===
+def parse_files(items):
+    # items are (path, known_sha256) pairs; files whose hash still matches are not parsed
+    columns = {field.name: [] for field in SCHEMA}
+    skipped = []
+    digests = {}
+    parsed = []
+
+    for path, known in items:
+        path = Path(path)
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            digests[path.stem] = hashlib.sha256(raw).hexdigest()
+            if digests[path.stem] == known:
+                continue
+            ein = int(path.stem)
+            data = json.loads(raw)
+        except Exception as e:
+            skipped.append((path.stem, str(e)))
+            continue
 
+        parsed.append(ein)
         if "error" in data and data["error"] == "Not Found":
             continue
 
         org_name = data.get("organization", {}).get("name", "Unknown")
 
-        for filing in data.get("filings_with_data", []):
-            year = filing.get("tax_prd_yr")
-            revenue = filing.get("totrevenue")
-            expenses = filing.get("totfuncexpns")
-            assets = filing.get("totassetsend")
-            program = filing.get("totprgmrevnue")
-            contributions = filing.get("totcntrbgfts")
-
-            # Safely calculate program_pct
-            try:
-                revenue_val = float(revenue) if revenue not in [None, "", "null"] else 0
-                program_val = float(program) if program not in [None, "", "null"] else 0
-                program_pct = (program_val / revenue_val) * 100 if revenue_val > 0 else None
-            except:
-                program_pct = None
-
-            if all(v in [None, 0, "", "null"] for v in [revenue, expenses, assets, program, contributions]):
+        # Newest filing first within each EIN, matching the old sort order
+        filings = sorted(
+            data.get("filings_with_data", []),
+            key=lambda f: to_year(f.get("tax_prd_yr")) or 0,
+            reverse=True,
+        )
+        for filing in filings:
+            values = {col: to_number(filing.get(key)) for col, key in NUMERIC_FIELDS.items()}
+
+            if all(not v for v in values.values()):
                 continue  # Skip completely empty records
 
-            records.append({
-                "EIN": ein,
-                "ORG_NAME": org_name,
-                "YEAR": year,
-                "REVENUE": revenue,
-                "EXPENSES": expenses,
-                "ASSETS": assets,
-                "PROGRAM_REVENUE": program,
-                "CONTRIBUTIONS": contributions,
-                "PROGRAM_PCT": round(program_pct, 2) if program_pct is not None else None
-            })
-
-    except Exception as e:
-        print(f"⚠️ Skipped {ein}: {e}")
-        continue
-
-df = pd.DataFrame(records)
-df = df.sort_values(by=["EIN", "YEAR"], ascending=[True, False])
-df.to_csv(output_file, index=False)
-
-print(f"✅ Flattened financials saved to {output_file}")
-print(f"📊 Total records: {len(df)}")
-print(f"📁 Unique EINs: {df['EIN'].nunique()}")
\ No newline at end of file
+            revenue_val = values["REVENUE"] or 0
+            program_val = values["PROGRAM_REVENUE"] or 0
+            program_pct = round((program_val / revenue_val) * 100, 2) if revenue_val > 0 else None
+
+            columns["EIN"].append(ein)
+            columns["ORG_NAME"].append(org_name)
+            columns["YEAR"].append(to_year(filing.get("tax_prd_yr")))
+            for col, value in values.items():
+                columns[col].append(value)
+            columns["PROGRAM_PCT"].append(program_pct)
+
+    return columns, skipped, digests, parsed
+
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# === Change detection ===
+def load_manifest(path):
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def scan_changes(in_dir, manifest):
+    # Returns (files to hash/parse as (path, known_sha256), stat by stem, stems that disappeared)
+    candidates = []
+    stats = {}
+    for entry in os.scandir(in_dir):
+        if not entry.name.endswith(".json"):
+            continue
+        stem = entry.name[:-5]
+        st = entry.stat()
+        stats[stem] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+        known = manifest.get(stem)
+        if known and known["mtime_ns"] == st.st_mtime_ns and known["size"] == st.st_size:
+            continue
+        candidates.append((entry.path, known["sha256"] if known else None))
+    removed = [stem for stem in manifest if stem not in stats]
+    candidates.sort()
+    return candidates, stats, removed
+
+
+def flatten(items, out_path, previous=None, drop=(), workers=None, batch_size=500):
+    # Stream freshly parsed batches into a new Parquet file, then append the rows of
+    # `previous` (the old store) for every EIN that was neither re-parsed nor in `drop`.
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_suffix(".parquet.tmp")
+    digests = {}
+    replaced = set(int(stem) for stem in drop if stem.isdigit())
+    stats = {"parsed": 0, "new_rows": 0, "kept_rows": 0}
+
+    writer = pq.ParquetWriter(tmp_path, SCHEMA)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for columns, skipped, batch_digests, parsed in pool.map(parse_files, chunked(items, batch_size)):
+                for ein, err in skipped:
+                    print(f"⚠️ Skipped {ein}: {err}")
+                digests.update(batch_digests)
+                replaced.update(parsed)
+                stats["parsed"] += len(parsed)
+                batch = pa.RecordBatch.from_pydict(columns, schema=SCHEMA)
+                if batch.num_rows:
+                    writer.write_batch(batch)
+                    stats["new_rows"] += batch.num_rows
+
+        if previous is not None:
+            old = pq.read_table(previous, schema=SCHEMA)
+            if replaced:
+                old = old.filter(pc.invert(pc.is_in(old["EIN"], value_set=pa.array(sorted(replaced), pa.int64()))))
+            writer.write_table(old)
+            stats["kept_rows"] = old.num_rows
+    finally:
+        writer.close()
+    os.replace(tmp_path, out_path)
+    return digests, stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Flatten cached ProPublica JSON into a typed financial timeseries")
+    parser.add_argument("--input-dir", type=Path, default=input_dir)
+    parser.add_argument("--output", type=Path, default=output_file)
+    parser.add_argument("--manifest", type=Path, default=manifest_file)
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-parse every file")
+    parser.add_argument("--csv", action="store_true", help=f"Also export {csv_export}")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=500, help="Files per worker task")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    tracer = script_tracer("flatten_financials")
+    incremental = not opts.full and opts.output.exists() and opts.manifest.exists()
+    manifest = load_manifest(opts.manifest) if incremental else {}
+
+    candidates, file_stats, removed = scan_changes(opts.input_dir, manifest)
+    if incremental:
+        print(f"🔎 {len(candidates)} new or modified files, {len(removed)} removed, "
+              f"{len(file_stats) - len(candidates)} unchanged")
+    tracer.mark("scan", rows=len(file_stats))
+
+    if candidates or removed or not incremental:
+        digests, stats = flatten(
+            candidates,
+            opts.output,
+            previous=opts.output if incremental else None,
+            drop=removed,
+            workers=opts.workers,
+            batch_size=opts.batch_size,
+        )
+        print(f"✅ Flattened financials saved to {opts.output}")
+        print(f"📊 Parsed {stats['parsed']} EINs into {stats['new_rows']} records, kept {stats['kept_rows']} unchanged records")
+    else:
+        digests = {}
+        print(f"✅ Nothing changed, {opts.output} is up to date")
+    tracer.mark("flatten", rows=len(candidates))
+
+    # Record what each file looked like when it was flattened
+    manifest = {stem: entry for stem, entry in manifest.items() if stem in file_stats}
+    for stem, digest in digests.items():
+        manifest[stem] = {**file_stats[stem], "sha256": digest}
+    save_manifest(opts.manifest, manifest)
+    tracer.mark("manifest", rows=len(manifest))
+
+    if opts.csv:
+        csv_path = export_csv(opts.output)
+        print(f"📄 CSV export saved to {csv_path}")
+
+    eins = pq.read_table(opts.output, columns=["EIN"])["EIN"]
+    print(f"📁 Unique EINs: {pc.count_distinct(eins).as_py()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,109 @@
-import pandas as pd
+import argparse
 from pathlib import Path
 
+from cubes import build_momentum_cube, momentum_cube_file
+from perf import script_tracer
+from schema import conform, csv_dtypes
+from storage import in_order, incremental_eins, read_table, upsert_rows, write_table
+
 # === File paths ===
-mapped_path = Path("data/processed/allegheny_mapped.csv")
-momentum_path = Path("data/processed/momentum_classification.csv")
-timeseries_path = Path("data/processed/financial_timeseries.csv")
-output_combined = Path("data/processed/org_master_profiles.csv")
+mapped_path = Path("data/processed/allegheny_mapped.parquet")
+momentum_path = Path("data/processed/momentum_classification.parquet")
+timeseries_path = Path("data/processed/financial_timeseries.parquet")
+output_combined = Path("data/processed/org_master_profiles.parquet")
 output_scoring = Path("data/processed/target_cohort_scores.csv")
 
-# === Load data ===
-mapped = pd.read_csv(mapped_path, dtype=str)
-momentum = pd.read_csv(momentum_path, dtype=str)
-timeseries = pd.read_csv(timeseries_path, dtype=str)
-
-# Ensure numerics
-momentum["AVG_RECENT_REVENUE"] = pd.to_numeric(momentum["AVG_RECENT_REVENUE"], errors="coerce")
-
-timeseries["YEAR"] = pd.to_numeric(timeseries["YEAR"], errors="coerce")
-timeseries["REVENUE"] = pd.to_numeric(timeseries["REVENUE"], errors="coerce")
-timeseries["PROGRAM_PCT"] = pd.to_numeric(timeseries["PROGRAM_PCT"], errors="coerce")
-
-# Use latest year per EIN
-latest_year = timeseries.groupby("EIN")["YEAR"].max().reset_index()
-latest_data = timeseries.merge(latest_year, on=["EIN", "YEAR"], how="inner")
-
-# Keep only EIN + REVENUE + PROGRAM_PCT
-if "PROGRAM_PCT" not in latest_data.columns:
-    latest_data["PROGRAM_PCT"] = None
-latest_data = latest_data[["EIN", "REVENUE", "PROGRAM_PCT"]]
-
-# === Merge everything ===
-df = mapped.merge(momentum, on="EIN", how="inner")
-df = df.merge(latest_data, on="EIN", how="left")
-
-# === Flag hollow orgs ===
-def flag_hollow(row):
-    try:
-        rev = float(row["REVENUE"]) if row["REVENUE"] not in [None, "", "nan"] else 0
-        pct = float(row["PROGRAM_PCT"]) if row["PROGRAM_PCT"] not in [None, "", "nan"] else 0
-        return rev > 50000 and pct < 20
-    except:
-        return False
-
-df["IS_HOLLOW"] = df.apply(flag_hollow, axis=1)
-
-# === Flag turbulent momentum ===
-df["IS_TURBULENT"] = df["MOMENTUM_CLASS"].str.lower().str.contains("turbulent")
-
-# === Save merged profile ===
-df.to_csv(output_combined, index=False)
-print(f"✅ Full org profile saved to {output_combined}")
-
-# === Grouped summary matrix ===
-summary = df.groupby(["SECTOR", "SIZE_BUCKET", "MOMENTUM_CLASS"]).agg(
-    ORG_COUNT=("EIN", "count"),
-    AVG_REVENUE=("REVENUE", "mean"),
-    AVG_PROGRAM_PCT=("PROGRAM_PCT", "mean"),
-    PCT_HOLLOW=("IS_HOLLOW", "mean"),
-    PCT_TURBULENT=("IS_TURBULENT", "mean")
-).reset_index()
-
-summary["AVG_REVENUE"] = summary["AVG_REVENUE"].round(0).astype("Int64")
-summary["AVG_PROGRAM_PCT"] = summary["AVG_PROGRAM_PCT"].round(1)
-summary["PCT_HOLLOW"] = (summary["PCT_HOLLOW"] * 100).round(1)
-summary["PCT_TURBULENT"] = (summary["PCT_TURBULENT"] * 100).round(1)
-
-summary.to_csv(output_scoring, index=False)
-print(f"📊 Target cohort scoring grid saved to {output_scoring}")
\ No newline at end of file
+
+def latest_filings(timeseries):
+    # One row per EIN: its latest tax year, in one sort + dedupe pass (no groupby and
+    # merge back). The sort is stable, so several filings for that year (amended
+    # returns) resolve to the one listed last and reruns always pick the same row.
+    latest = timeseries.dropna(subset=["YEAR"]).sort_values("YEAR", kind="stable")
+    latest = latest.drop_duplicates("EIN", keep="last")
+    return latest.set_index("EIN")[["REVENUE", "PROGRAM_PCT"]]
+
+
+def merge_profiles(mapped, momentum, latest):
+    # Orgs with a momentum classification, plus their latest revenue / program %.
+    # All three are keyed on the integer EIN; row order follows `mapped`.
+    df = mapped.join(momentum.set_index("EIN"), on="EIN", how="inner")
+    df = df.join(latest, on="EIN", how="left")
+
+    # Hollow: real revenue but little of it from programs (missing values never count)
+    df["IS_HOLLOW"] = (df["REVENUE"] > 50_000) & (df["PROGRAM_PCT"] < 20)
+    df["IS_TURBULENT"] = df["MOMENTUM_CLASS"].str.lower().str.contains("turbulent")
+    return df.reset_index(drop=True)
+
+
+def cohort_summary(df):
+    summary = df.groupby(["SECTOR", "SIZE_BUCKET", "MOMENTUM_CLASS"]).agg(
+        ORG_COUNT=("EIN", "count"),
+        AVG_REVENUE=("REVENUE", "mean"),
+        AVG_PROGRAM_PCT=("PROGRAM_PCT", "mean"),
+        PCT_HOLLOW=("IS_HOLLOW", "mean"),
+        PCT_TURBULENT=("IS_TURBULENT", "mean")
+    ).reset_index()
+
+    summary["AVG_REVENUE"] = summary["AVG_REVENUE"].round(0).astype("Int64")
+    summary["AVG_PROGRAM_PCT"] = summary["AVG_PROGRAM_PCT"].round(1)
+    summary["PCT_HOLLOW"] = (summary["PCT_HOLLOW"] * 100).round(1)
+    summary["PCT_TURBULENT"] = (summary["PCT_TURBULENT"] * 100).round(1)
+    return summary
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Merge mapped orgs, momentum and latest financials into org profiles")
+    parser.add_argument("--mapped", type=Path, default=mapped_path)
+    parser.add_argument("--momentum", type=Path, default=momentum_path)
+    parser.add_argument("--timeseries", type=Path, default=timeseries_path)
+    parser.add_argument("--output", type=Path, default=output_combined)
+    parser.add_argument("--summary", type=Path, default=output_scoring)
+    parser.add_argument("--cube", type=Path, default=momentum_cube_file, help="Momentum chart cube for the dashboard")
+    parser.add_argument("--changed-eins", type=Path, help="Only rebuild these EINs' profiles (one per line) and upsert them into --output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    tracer = script_tracer("merge_and_score", incremental=bool(opts.changed_eins))
+
+    eins, filters = incremental_eins(opts.changed_eins, opts.output)
+    if eins == []:
+        return
+
+    # === Load data ===
+    mapped = conform(read_table(opts.mapped, csv_dtype=csv_dtypes(), filters=filters))
+    momentum = conform(read_table(opts.momentum, csv_dtype=csv_dtypes(), filters=filters))
+    timeseries = conform(read_table(opts.timeseries, columns=["EIN", "YEAR", "REVENUE", "PROGRAM_PCT"], filters=filters))
+    tracer.mark("load", rows=len(timeseries))
+
+    # === Merge everything ===
+    df = merge_profiles(mapped, momentum, latest_filings(timeseries))
+    tracer.mark("merge", rows=len(df))
+
+    # Changed profiles replace their old rows, in the mapped file's order
+    if eins is not None:
+        print(f"🔁 Rebuilt {len(df)} profiles for {len(eins)} changed EINs")
+        df = upsert_rows(conform(read_table(opts.output)), conform(df), eins)
+        df = in_order(df, conform(read_table(opts.mapped, columns=["EIN"], csv_dtype=csv_dtypes()))["EIN"])
+        tracer.mark("upsert", rows=len(df))
+
+    # === Save merged profile ===
+    write_table(conform(df), opts.output)
+    print(f"✅ Full org profile saved to {opts.output}")
+    tracer.mark("save", rows=len(df))
+
+    # === Grouped summary matrix (always over every profile) ===
+    cohort_summary(df).to_csv(opts.summary, index=False)
+    print(f"📊 Target cohort scoring grid saved to {opts.summary}")
+    tracer.mark("cohort summary", rows=len(df))
+
+    # === Momentum chart cube for the dashboard ===
+    momentum_cube = build_momentum_cube(df)
+    write_table(momentum_cube, opts.cube)
+    print(f"🧊 Momentum chart cube saved to {opts.cube}")
+    tracer.mark("momentum cube", rows=len(momentum_cube))
+
+
+if __name__ == "__main__":
+    main()
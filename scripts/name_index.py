@@ -0,0 +1,278 @@
+import argparse
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from perf import script_tracer
+from schema import conform, csv_dtypes
+from storage import read_table
+
+# === File paths ===
+profiles_path = Path("data/processed/org_master_profiles_scored.parquet")
+index_file = Path("data/processed/name_index.joblib")
+duplicates_file = Path("data/processed/duplicate_orgs.csv")
+
+# === Org name index ===
+# A trigram inverted index over each org's names (NAME from the IRS master file, ORG_NAME
+# from the filings). Names are normalised first (upper case, ASCII, punctuation and
+# filler words like THE / INC dropped), then every word is cut into trigrams
+# pg_trgm-style ("  T", " TR", "TRE", ...). A trigram is a number < 37**3, and the
+# index keeps, per trigram, the sorted list of names containing it.
+#
+# A search counts how many of the query's trigrams each name shares. Names holding at
+# least `min_coverage` of them match (so typos and word fragments still hit); among
+# those the closest whole name (Dice similarity) comes first, so a long name that merely
+# contains the query doesn't outrank the org itself.
+# Rows are positions in the profiles table the index was built from (see `eins`).
+NAME_COLUMNS = ["NAME", "ORG_NAME"]
+FILLER_WORDS = ["THE", "INC", "INCORPORATED", "CORP", "CORPORATION", "CO", "LTD", "LLC", "OF", "AND"]
+
+ALPHABET = 37  # space, 0-9, A-Z
+GRAMS = ALPHABET ** 3
+_CHAR_CODES = np.zeros(256, dtype=np.int64)
+_CHAR_CODES[np.frombuffer(b"0123456789", dtype=np.uint8)] = np.arange(1, 11)
+_CHAR_CODES[np.frombuffer(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ", dtype=np.uint8)] = np.arange(11, 37)
+
+
+def normalize_names(values):
+    names = pd.Series(values, dtype="string[pyarrow]").fillna("")
+    # Accents off (É -> E) for the few names that aren't plain ASCII
+    accented = ~names.str.isascii()
+    if accented.any():
+        names[accented] = names[accented].str.normalize("NFKD").str.encode("ascii", "ignore").str.decode("ascii")
+    names = names.str.upper().str.replace(r"[^A-Z0-9]+", " ", regex=True)
+    cleaned = names.str.replace(r"\b(?:" + "|".join(FILLER_WORDS) + r")\b", " ", regex=True)
+    # A name made only of filler words keeps them
+    names = cleaned.where(cleaned.str.strip() != "", names)
+    return names.str.replace(r" +", " ", regex=True).str.strip()
+
+
+def name_grams(names, chunk_size=200_000):
+    # (name position, trigram) pairs, unique and sorted by name then trigram
+    positions, grams = [], []
+    for start in range(0, len(names), chunk_size):
+        chunk = list(names[start:start + chunk_size])
+        padded = ["  " + name.replace(" ", "  ") + " " for name in chunk]
+        lengths = np.fromiter((len(p) for p in padded), dtype=np.int64, count=len(padded))
+        chars = _CHAR_CODES[np.frombuffer("".join(padded).encode("ascii"), dtype=np.uint8)]
+        owner = np.repeat(np.arange(len(chunk)), lengths)
+
+        # Windows inside one name, skipping the "x  " window between two words
+        first = np.arange(len(chars) - 2)
+        keep = (owner[first] == owner[first + 2]) & ~((chars[first + 1] == 0) & (chars[first + 2] == 0))
+        first = first[keep]
+        codes = (chars[first] * ALPHABET + chars[first + 1]) * ALPHABET + chars[first + 2]
+
+        keys = _distinct((owner[first] + start) * GRAMS + codes)
+        positions.append(keys // GRAMS)
+        grams.append(keys % GRAMS)
+    if not positions:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(positions), np.concatenate(grams)
+
+
+def _distinct(values):
+    # Sorted distinct values (a sort and a mask: much faster than np.unique on millions)
+    values = np.sort(values)
+    return values[np.concatenate([[True], values[1:] != values[:-1]])] if len(values) else values
+
+
+class NameIndex:
+    def __init__(self, df, columns=NAME_COLUMNS):
+        self.eins = df["EIN"].to_numpy(dtype=np.int64)
+        self.n = len(df)
+
+        # One entry per distinct name of each org, in row order
+        names = pd.DataFrame({
+            "ROW": np.tile(np.arange(self.n), len(columns)),
+            "KEY": pd.concat([normalize_names(df[col]) for col in columns], ignore_index=True),
+        })
+        names = names[names["KEY"] != ""].drop_duplicates().sort_values("ROW", kind="stable")
+        self.entry_rows = names["ROW"].to_numpy(dtype=np.int32)
+        # Which numbers each name holds ("VFW POST 4356" -> the code for "4356")
+        self.numbers = pd.factorize(names["KEY"].str.replace(r"[^0-9]+", " ", regex=True).str.strip())[0]
+
+        entries, grams = name_grams(names["KEY"].to_numpy())
+        self.sizes = np.bincount(entries, minlength=len(names)).astype(np.int32)
+        order = np.argsort(grams, kind="stable")
+        self.postings = entries[order].astype(np.int32)
+        self.offsets = np.searchsorted(grams[order], np.arange(GRAMS + 1))
+
+    def _shared(self, text):
+        # Query trigram count, and the entries sharing any of them with how many they share
+        grams = name_grams(normalize_names([text]).to_numpy())[1]
+        if not len(grams):
+            return 0, np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        hits = np.concatenate([self.postings[self.offsets[g]:self.offsets[g + 1]] for g in grams])
+        shared = np.bincount(hits, minlength=len(self.entry_rows))
+        entries = np.flatnonzero(shared)
+        return len(grams), entries, shared[entries]
+
+    def search(self, text, rows=None, limit=None, min_coverage=0.6):
+        # Matching rows (restricted to `rows` if given) and their similarity, closest first
+        size, entries, shared = self._shared(text)
+        coverage = shared / max(size, 1)
+        keep = coverage >= min_coverage
+        entries, shared, coverage = entries[keep], shared[keep], coverage[keep]
+        found = self.entry_rows[entries]
+        if rows is not None:
+            keep = np.isin(found, rows)
+            entries, shared, coverage, found = entries[keep], shared[keep], coverage[keep], found[keep]
+        dice = 2 * shared / (size + self.sizes[entries])
+
+        # Each org's best name, then best orgs first; ties go to the earlier row
+        order = np.lexsort((-coverage, -dice, found))
+        best = order[np.concatenate([[True], found[order][1:] != found[order][:-1]])] if len(order) else order
+        best = best[np.lexsort((found[best], -coverage[best], -dice[best]))][:limit]
+        return found[best], dice[best]
+
+    def matches(self, text, rows=None, min_coverage=0.6):
+        # Positions (ascending) of the rows matching `text`
+        return np.sort(self.search(text, rows, min_coverage=min_coverage)[0])
+
+    def duplicates(self, threshold=0.85, chunk_size=200_000):
+        # Pairs of rows with different EINs whose names are at least `threshold` similar
+        # (Dice over trigrams) and hold the same numbers (VFW POST 4356 and 4365 are two
+        # posts), as ROW_A < ROW_B with the best SIMILARITY of their names. Two names that
+        # similar share a trigram among each one's rarest few, so only names sharing one of
+        # those are compared (prefix filtering).
+        counts = np.diff(self.offsets)
+        grams = np.repeat(np.arange(GRAMS), counts)
+        order = np.lexsort((grams, counts[grams], self.postings))
+        entries, grams = self.postings[order], grams[order]
+
+        # Each entry's trigrams, rarest first (also as a name x trigram matrix)
+        starts = np.cumsum(self.sizes) - self.sizes
+        matrix = sp.csr_matrix((np.ones(len(grams), dtype=np.int32), grams, np.append(starts, len(grams))),
+                               shape=(len(self.sizes), GRAMS))
+        position = np.arange(len(entries)) - starts[entries]
+        jaccard = threshold / (2 - threshold)
+        prefix = self.sizes - np.ceil(jaccard * self.sizes - 1e-9).astype(np.int64) + 1
+        in_prefix = position < prefix[entries]
+
+        # Candidate pairs: entries with the same numbers sharing a prefix trigram, checked
+        # a batch at a time
+        entries, grams = entries[in_prefix], grams[in_prefix]
+        order = np.lexsort((entries, self.numbers[entries], grams))
+        entries, grams, numbers = entries[order], grams[order], self.numbers[entries[order]]
+        new_group = (np.diff(grams, prepend=-1) != 0) | (np.diff(numbers, prepend=-1) != 0)
+        group = np.cumsum(new_group) - 1
+        shared = np.bincount(group)[group] > 1 if len(group) else new_group
+        groups = np.split(entries[shared], np.flatnonzero(new_group[shared])[1:])
+        found, batch, batched = [], [], 0
+        for a, b in _group_pairs(groups, chunk_size):
+            batch.append((a, b))
+            batched += len(a)
+            if batched >= chunk_size:
+                found.append(self._similar(*map(np.concatenate, zip(*batch)), matrix, threshold))
+                batch, batched = [], 0
+        if batch:
+            found.append(self._similar(*map(np.concatenate, zip(*batch)), matrix, threshold))
+
+        pairs = pd.concat(found, ignore_index=True) if found else pd.DataFrame(columns=["ROW_A", "ROW_B", "SIMILARITY"])
+        swap = pairs["ROW_A"] > pairs["ROW_B"]
+        pairs.loc[swap, ["ROW_A", "ROW_B"]] = pairs.loc[swap, ["ROW_B", "ROW_A"]].to_numpy()
+        pairs = pairs.sort_values(["SIMILARITY", "ROW_A", "ROW_B"], ascending=[False, True, True], kind="stable")
+        return pairs.drop_duplicates(["ROW_A", "ROW_B"]).reset_index(drop=True)
+
+    def _similar(self, a, b, matrix, threshold):
+        # Candidate entry pairs (a, b) from different EINs with Dice >= threshold. Names
+        # whose trigram counts are too far apart can't get there, so only the rest are compared.
+        la, lb = self.sizes[a], self.sizes[b]
+        jaccard = threshold / (2 - threshold)
+        keep = (np.minimum(la, lb) >= jaccard * np.maximum(la, lb) - 1e-9) & (
+            self.eins[self.entry_rows[a]] != self.eins[self.entry_rows[b]])
+        a, b, la, lb = a[keep], b[keep], la[keep], lb[keep]
+        overlap = np.asarray(matrix[a].multiply(matrix[b]).sum(axis=1)).ravel()
+        similarity = 2 * overlap / np.maximum(la + lb, 1)
+        hit = similarity >= threshold
+        return pd.DataFrame({
+            "ROW_A": self.entry_rows[a[hit]],
+            "ROW_B": self.entry_rows[b[hit]],
+            "SIMILARITY": similarity[hit].round(3),
+        })
+
+
+def _group_pairs(groups, chunk_size):
+    # Every pair within each group, as (a, b) arrays of at most ~chunk_size pairs
+    for group in groups:
+        if len(group) < 2:
+            continue
+        if len(group) * (len(group) - 1) // 2 <= chunk_size:
+            i, j = np.triu_indices(len(group), 1)
+            yield group[i], group[j]
+            continue
+        # A very common name: pair each member with the ones after it, a few members at a time
+        step = max(1, chunk_size // len(group))
+        for lo in range(0, len(group) - 1, step):
+            members = range(lo, min(lo + step, len(group) - 1))
+            yield (np.concatenate([np.full(len(group) - k - 1, group[k]) for k in members]),
+                   np.concatenate([group[k + 1:] for k in members]))
+
+
+def save_name_index(index, path=index_file):
+    # Saved as its plain arrays rather than a pickled NameIndex, so the file loads the
+    # same whether this module ran as a script or was imported
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    joblib.dump(vars(index), tmp)
+    tmp.replace(path)
+    return path
+
+
+def load_name_index(path=index_file):
+    # Arrays are memory-mapped, so processes loading the same index share one copy
+    index = object.__new__(NameIndex)
+    vars(index).update(joblib.load(path, mmap_mode="r"))
+    return index
+
+
+def duplicate_table(df, pairs):
+    # The duplicate pairs with both orgs' EIN, name and city
+    name = df["NAME"].fillna(df["ORG_NAME"]) if "ORG_NAME" in df.columns else df["NAME"]
+    orgs = pd.DataFrame({"EIN": df["EIN"].to_numpy(), "NAME": name.to_numpy(), "CITY": df["CITY"].to_numpy()})
+    a = orgs.iloc[pairs["ROW_A"]].reset_index(drop=True).add_suffix("_A")
+    b = orgs.iloc[pairs["ROW_B"]].reset_index(drop=True).add_suffix("_B")
+    return pd.concat([a, b, pairs[["SIMILARITY"]].reset_index(drop=True)], axis=1)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the org name search index and list likely duplicate orgs")
+    parser.add_argument("--profiles", type=Path, default=profiles_path)
+    parser.add_argument("--output", type=Path, default=index_file)
+    parser.add_argument("--duplicates", type=Path, default=duplicates_file)
+    parser.add_argument("--threshold", type=float, default=0.85, help="Name similarity (0-1) for a likely duplicate")
+    opts = parser.parse_args(argv)
+    if not 0 < opts.threshold <= 1:
+        parser.error("--threshold must be in (0, 1]")
+    return opts
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    tracer = script_tracer("name_index")
+
+    # === Load data (row order must match what the dashboard reads) ===
+    df = conform(read_table(opts.profiles, columns=["EIN", "CITY", *NAME_COLUMNS], csv_dtype=csv_dtypes()))
+    tracer.mark("load", rows=len(df))
+
+    # === Build and save the index ===
+    index = NameIndex(df)
+    tracer.mark("build index", rows=len(index.entry_rows))
+    save_name_index(index, opts.output)
+    print(f"🔎 Indexed {len(index.entry_rows):,} names of {index.n:,} orgs to {opts.output}")
+    tracer.mark("save index", rows=index.n)
+
+    # === Likely duplicates across EINs ===
+    duplicates = duplicate_table(df, index.duplicates(opts.threshold))
+    duplicates.to_csv(opts.duplicates, index=False)
+    print(f"🧬 {len(duplicates):,} likely duplicate org pairs saved to {opts.duplicates}")
+    tracer.mark("duplicates", rows=len(duplicates))
+
+
+if __name__ == "__main__":
+    main()
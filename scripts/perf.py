@@ -0,0 +1,148 @@
+import argparse
+import atexit
+import contextvars
+import functools
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+
+# === Hot-path timing ===
+# Where a pipeline run or a dashboard interaction spends its time. Each run gets one
+# Tracer (script_tracer() in a script, one per rerun in the dashboard), made current for its
+# thread, and two ways to record into it:
+#   tracer.mark("load", rows=len(df))  -> time, rows and memory change since the last mark
+#   @timed("read_table")               -> one record per call of a shared helper
+# The marks of a run add up to its "total" record; timed calls happen inside them.
+# Records stay on the tracer (the dashboard's performance expander shows them) and, when
+# PERF_LOG names a file, are appended there as JSON lines once the run finishes:
+#   {"ts", "scope", "run", <context>, "step", "kind", "ms", "rows", "mem_mb"}
+# Disabled (the default), mark() and timed functions return after one check.
+
+PERF_LOG_ENV = "PERF_LOG"
+_PAGE_MB = (os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096) / 2**20
+_current = contextvars.ContextVar("perf_tracer", default=None)
+
+
+def rss_mb():
+    # Resident memory in MB right now (Linux); None where /proc isn't available
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except OSError:
+        return None
+
+
+def log_path():
+    return os.environ.get(PERF_LOG_ENV) or None
+
+
+class Tracer:
+    def __init__(self, scope, enabled=False, log_path=None, **context):
+        self.scope = scope
+        self.log_path = log_path
+        self.enabled = enabled or bool(log_path)
+        self.context = context
+        self.run = uuid.uuid4().hex[:12]
+        self.records = []
+        self.finished = False
+        self.started = self._lap = time.perf_counter()
+        self._start_mem = self._lap_mem = rss_mb() if self.enabled else None
+
+    def mark(self, step, rows=None):
+        # Closes the step that began at the previous mark (or the start)
+        if not self.enabled:
+            return
+        now, mem = time.perf_counter(), rss_mb()
+        self._add("step", step, now - self._lap, rows, mem, self._lap_mem)
+        self._lap, self._lap_mem = now, mem
+
+    def _add(self, kind, step, seconds, rows, mem, mem_before):
+        self.records.append({
+            "step": step,
+            "kind": kind,
+            "ms": round(seconds * 1000, 3),
+            "rows": rows,
+            "mem_mb": round(mem - mem_before, 1) if mem is not None and mem_before is not None else None,
+        })
+
+    def finish(self, rows=None):
+        # Adds the run's "total" and appends every record to the JSONL log, once
+        if not self.enabled or self.finished:
+            return
+        self.finished = True
+        self._add("total", "total", time.perf_counter() - self.started, rows, rss_mb(), self._start_mem)
+        if self.log_path:
+            base = {"ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                    "scope": self.scope, "run": self.run, **self.context}
+            lines = "".join(json.dumps({**base, **record}) + "\n" for record in self.records)
+            Path(self.log_path).parent.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, "a") as f:
+                f.write(lines)
+
+
+def activate(tracer):
+    # Makes `tracer` the one timed() functions record into, for this thread
+    _current.set(tracer)
+    return tracer
+
+
+def script_tracer(scope, **context):
+    # The tracer for a pipeline script: on when PERF_LOG is set, logged at exit
+    tracer = activate(Tracer(scope, log_path=log_path(), **context))
+    if tracer.enabled:
+        atexit.register(tracer.finish)
+    return tracer
+
+
+def timed(step=None):
+    # Decorator: records each call (rows = len() of the result, if it has one)
+    def wrap(fn):
+        name = step or fn.__qualname__
+
+        @functools.wraps(fn)
+        def timed_fn(*args, **kwargs):
+            tracer = _current.get()
+            if tracer is None or not tracer.enabled:
+                return fn(*args, **kwargs)
+            started, mem = time.perf_counter(), rss_mb()
+            result = fn(*args, **kwargs)
+            rows = len(result) if hasattr(result, "__len__") else None
+            tracer._add("call", name, time.perf_counter() - started, rows, rss_mb(), mem)
+            return result
+        return timed_fn
+    return wrap
+
+
+def summarize(path):
+    # Per scope and step from a JSONL log: runs, median / p95 / max ms, median rows
+    log = pd.read_json(path, lines=True)
+    grouped = log.groupby(["scope", "kind", "step"], sort=False)
+    return grouped.agg(
+        RUNS=("run", "nunique"),
+        MEDIAN_MS=("ms", "median"),
+        P95_MS=("ms", lambda ms: ms.quantile(0.95)),
+        MAX_MS=("ms", "max"),
+        MEDIAN_ROWS=("rows", "median"),
+        MEDIAN_MEM_MB=("mem_mb", "median"),
+    ).round(1).reset_index()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize a PERF_LOG file (timings per script / dashboard step)")
+    parser.add_argument("log", type=Path)
+    parser.add_argument("--scope", help="Only this script (e.g. analyze_momentum) or dashboard")
+    opts = parser.parse_args(argv)
+
+    summary = summarize(opts.log)
+    if opts.scope:
+        summary = summary[summary["scope"] == opts.scope]
+    print(summary.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+
+state_file = Path("data/processed/pipeline_state.json")
+
+# === Stage graph ===
+# Every stage is one script, run from the repo root. A stage re-runs only when the content
+# of its inputs or its code changed since its last successful run (or an output is missing).
+# Stages depend on whichever stages produce their inputs, so independent ones run in parallel.
+#
+# Stages with `by_ein` inputs can also update their outputs in place for a list of changed
+# EINs (--changed-eins, e.g. the list fetch_990_financials.py writes after a refresh). The
+# runner only asks for that when
+#   - everything else about the stage (code, args and every input not in `by_ein` or
+#     `joined`) is exactly as it was at its last run, and
+#   - each `by_ein` input that changed was changed in this run by an upstream stage that
+#     only updated the listed EINs, starting from the version this stage last read.
+# Otherwise it runs in full. `joined` inputs are re-read whole by the update path, so any
+# change to them is fine. `incremental` stages work out what changed themselves (no
+# argument); `lists_changes` names the list a stage writes, so a run of it (same code and
+# args) changed only EINs in that list. Each run's mode ("full" / "upsert") is kept in the
+# pipeline state.
+#
+# --refresh (with --ttl-days / --due-only) runs the `refresh` stage with those flags added
+# to its args. They aren't part of its key, so a refresh still counts as the same code and
+# args, and the stages below it update just the EINs it lists.
+STAGES = [
+    {
+        "name": "filter_regions",
+        "script": "scripts/filter_regions.py",
+        "code": ["scripts/storage.py"],
+        "inputs": ["data/raw", "data/regions.json"],
+        "outputs": ["data/processed/allegheny_nonprofits.parquet"],
+    },
+    {
+        "name": "classify_and_segment",
+        "script": "scripts/classify_and_segment.py",
+        "code": ["scripts/storage.py"],
+        "inputs": ["data/processed/allegheny_nonprofits.parquet", "data/sector_map.json"],
+        "outputs": [
+            "data/processed/allegheny_mapped.parquet",
+            "data/processed/summary_by_sector.csv",
+            "data/processed/summary_by_zip.csv",
+            "data/processed/top_orgs_by_revenue.csv",
+        ],
+    },
+    {
+        "name": "fetch_990_financials",
+        "script": "scripts/fetch_990_financials.py",
+        "code": ["scripts/storage.py"],
+        "inputs": ["data/processed/allegheny_mapped.parquet"],
+        "lists_changes": "data/processed/changed_eins.txt",
+        "refresh": True,
+        "outputs": ["data/financials_by_ein"],
+    },
+    {
+        "name": "flatten_financials",
+        "script": "scripts/flatten_financials.py",
+        "code": ["scripts/storage.py"],
+        "inputs": ["data/financials_by_ein"],
+        "by_ein": ["data/financials_by_ein"],
+        "incremental": True,
+        "outputs": ["data/processed/financial_timeseries.parquet"],
+    },
+    {
+        "name": "analyze_momentum",
+        "script": "scripts/analyze_momentum.py",
+        "code": ["scripts/storage.py"],
+        "inputs": ["data/processed/financial_timeseries.parquet"],
+        "by_ein": ["data/processed/financial_timeseries.parquet"],
+        "outputs": ["data/processed/momentum_classification.parquet"],
+    },
+    {
+        "name": "build_trajectories",
+        "script": "scripts/build_trajectories.py",
+        "code": ["scripts/storage.py"],
+        "inputs": ["data/processed/financial_timeseries.parquet"],
+        "by_ein": ["data/processed/financial_timeseries.parquet"],
+        "outputs": ["data/processed/org_trajectories.parquet"],
+    },
+    {
+        "name": "merge_and_score",
+        "script": "scripts/merge_and_score.py",
+        "code": ["scripts/cubes.py", "scripts/schema.py", "scripts/storage.py"],
+        "inputs": [
+            "data/processed/allegheny_mapped.parquet",
+            "data/processed/momentum_classification.parquet",
+            "data/processed/financial_timeseries.parquet",
+        ],
+        "by_ein": ["data/processed/momentum_classification.parquet", "data/processed/financial_timeseries.parquet"],
+        "outputs": [
+            "data/processed/org_master_profiles.parquet",
+            "data/processed/target_cohort_scores.csv",
+            "data/processed/momentum_cube.parquet",
+        ],
+    },
+    {
+        "name": "cluster_orgs",
+        "script": "scripts/cluster_orgs.py",
+        "code": ["scripts/schema.py", "scripts/storage.py"],
+        "inputs": ["data/processed/org_master_profiles.parquet", "data/processed/org_trajectories.parquet"],
+        "outputs": [
+            "data/processed/org_clusters.parquet",
+            "data/processed/cluster_model.joblib",
+            "data/processed/cluster_summary.csv",
+        ],
+    },
+    {
+        "name": "score_targets",
+        "script": "scripts/score_targets.py",
+        "code": ["scripts/scoring.py", "scripts/cubes.py", "scripts/storage.py"],
+        "inputs": [
+            "data/processed/org_master_profiles.parquet",
+            "data/processed/org_clusters.parquet",
+            "data/scoring_rules.json",
+        ],
+        "by_ein": ["data/processed/org_master_profiles.parquet"],
+        "joined": ["data/processed/org_clusters.parquet"],
+        "outputs": ["data/processed/org_master_profiles_scored.parquet", "data/processed/chart_cube.parquet"],
+    },
+    {
+        "name": "name_index",
+        "script": "scripts/name_index.py",
+        "code": ["scripts/schema.py", "scripts/storage.py"],
+        "inputs": ["data/processed/org_master_profiles_scored.parquet"],
+        "outputs": ["data/processed/name_index.joblib", "data/processed/duplicate_orgs.csv"],
+    },
+    {
+        "name": "build_zip_layer",
+        "script": "scripts/build_zip_layer.py",
+        "code": ["scripts/zip_map.py"],
+        "inputs": ["data/processed/summary_by_zip.csv", "data/regions.json", "data/raw"],
+        "outputs": [
+            "data/processed/zip_layer_coarse.geojson",
+            "data/processed/zip_layer_medium.geojson",
+            "data/processed/zip_layer_fine.geojson",
+        ],
+    },
+]
+
+
+def output_producers(stages):
+    # output path -> name of the stage writing it; raises on clashing outputs
+    producers = {}
+    for stage in stages:
+        for out in stage["outputs"]:
+            if out in producers:
+                raise ValueError(f"{out} is produced by both {producers[out]} and {stage['name']}")
+            producers[out] = stage["name"]
+    return producers
+
+
+def stage_graph(stages):
+    # name -> set of upstream stage names; raises on cycles or clashing outputs
+    producers = output_producers(stages)
+    deps = {
+        stage["name"]: {producers[i] for i in stage["inputs"] if i in producers} - {stage["name"]}
+        for stage in stages
+    }
+
+    seen, order = set(), []
+    while len(order) < len(deps):
+        ready = [name for name in deps if name not in seen and deps[name] <= seen]
+        if not ready:
+            raise ValueError(f"Cycle between stages: {sorted(set(deps) - seen)}")
+        seen.update(ready)
+        order.extend(ready)
+    return deps
+
+
+def with_upstream(targets, deps):
+    selected, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(deps[name])
+    return selected
+
+
+# === Content hashing ===
+class HashCache:
+    # sha256 per file, memoised on (size, mtime) across runs so unchanged files aren't re-read
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    def file(self, path):
+        st = os.stat(path)
+        cached = self.entries.get(path)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        self.entries[path] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+        return h.hexdigest()
+
+    def path(self, path):
+        if os.path.isdir(path):
+            h = hashlib.sha256()
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    full = os.path.join(root, name)
+                    h.update(f"{os.path.relpath(full, path)}\0{self.file(full)}\n".encode())
+            return h.hexdigest()
+        if os.path.exists(path):
+            return self.file(path)
+        return None
+
+    def prune(self):
+        # Forget files that no longer exist so the state file doesn't grow forever
+        self.entries = {p: v for p, v in self.entries.items() if os.path.exists(p)}
+
+
+def stage_parts(stage, hashes):
+    return {
+        "code": {p: hashes.path(p) for p in [stage["script"], *stage.get("code", [])]},
+        "inputs": {p: hashes.path(p) for p in stage["inputs"]},
+        "args": stage.get("args", []),
+    }
+
+
+def stage_key(parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def same_code(parts, last):
+    previous = last.get("parts")
+    return bool(previous) and previous["code"] == parts["code"] and previous["args"] == parts["args"]
+
+
+def can_upsert(stage, parts, last, upserted, producers):
+    # True when the stage can update just the listed EINs (see the top of the file).
+    # `upserted`: stage name -> output hashes before its upsert, for stages that
+    # updated only the listed EINs in this run
+    if not stage.get("by_ein") or not same_code(parts, last) or not all(os.path.exists(p) for p in stage["outputs"]):
+        return False
+    previous = last["parts"]["inputs"]
+    whole = set(stage["by_ein"]) | set(stage.get("joined", []))
+    if any(previous.get(p) != digest for p, digest in parts["inputs"].items() if p not in whole):
+        return False
+    for p in stage["by_ein"]:
+        if parts["inputs"][p] == previous.get(p):
+            continue
+        before = upserted.get(producers.get(p))
+        if before is None or before.get(p) != previous.get(p):
+            return False
+    return True
+
+
+def lists_own_changes(stage, parts, last, changed_eins):
+    # A stage writing the --changed-eins list only changes EINs on it (same code and args)
+    listed = stage.get("lists_changes")
+    return bool(listed) and os.path.exists(listed) and os.path.samefile(listed, changed_eins) and same_code(parts, last)
+
+
+# === Pipeline state ===
+def load_state(path):
+    if path.exists():
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"stages": {}, "hashes": {}}
+
+
+def save_state(path, state):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def utc_now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+# === Stage execution ===
+def run_stage(stage, python=sys.executable, cwd=None, stdout=None):
+    # Returns (exit code, wall seconds, peak RSS in MB or None where rusage isn't available)
+    cmd = [python, stage["script"], *stage.get("args", [])]
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=stdout)
+    if not hasattr(os, "wait4"):
+        return proc.wait(), time.perf_counter() - start, None
+
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return proc.returncode, wall, peak_mb
+
+
+def refresh_args(opts):
+    args = ["--refresh"]
+    if opts.ttl_days is not None:
+        args += ["--ttl-days", str(opts.ttl_days)]
+    if opts.due_only:
+        args.append("--due-only")
+    return args
+
+
+def run_pipeline(stages, opts):
+    by_name = {stage["name"]: stage for stage in stages}
+    deps = stage_graph(stages)
+    unknown = [name for name in opts.stages + opts.force if name != "all" and name not in by_name]
+    if unknown:
+        raise SystemExit(f"Unknown stage(s): {', '.join(unknown)} (choose from {', '.join(by_name)})")
+
+    targets = opts.stages or list(by_name)
+    selected = set(targets) if opts.only else with_upstream(targets, deps)
+    forced = set(by_name) if "all" in opts.force else set(opts.force)
+    refreshing = {stage["name"] for stage in stages if stage.get("refresh")} if opts.refresh else set()
+    forced |= refreshing
+
+    state = load_state(opts.state)
+    hashes = HashCache(state.get("hashes"))
+    producers = output_producers(stages)
+    results = {}
+    upserted = {}
+
+    def up_to_date(name, key):
+        last = state["stages"].get(name, {})
+        return last.get("key") == key and all(os.path.exists(p) for p in by_name[name]["outputs"])
+
+    def ready():
+        # Stages whose selected upstream stages have all finished (run or skipped)
+        return [
+            name for name in by_name
+            if name in selected and name not in results and name not in running_names
+            and all(results.get(dep) in ("ran", "skipped", "would run") for dep in deps[name] & selected)
+        ]
+
+    def blocked():
+        return [
+            name for name in by_name
+            if name in selected and name not in results
+            and any(results.get(dep) in ("failed", "blocked") for dep in deps[name] & selected)
+        ]
+
+    running, running_names = {}, set()
+    with ThreadPoolExecutor(max_workers=opts.jobs) as pool:
+        while True:
+            for name in blocked():
+                results[name] = "blocked"
+                print(f"⏭️  {name}: blocked by a failed upstream stage")
+
+            for name in ready():
+                stage = by_name[name]
+                missing = [p for p in stage["inputs"] if not os.path.exists(p)]
+                if missing:
+                    results[name] = "failed"
+                    print(f"❌ {name}: missing input {', '.join(missing)}")
+                    continue
+                parts = stage_parts(stage, hashes)
+                key = stage_key(parts)
+                if name not in forced and up_to_date(name, key):
+                    results[name] = "skipped"
+                    print(f"✅ {name}: up to date")
+                    continue
+                if opts.dry_run:
+                    # Downstream keys can't be known until this stage actually runs
+                    results[name] = "would run"
+                    print(f"🔜 {name}: would run")
+                    continue
+                last = state["stages"].get(name, {})
+                if opts.changed_eins and lists_own_changes(stage, parts, last, opts.changed_eins):
+                    mode = "upsert"
+                    print(f"▶️  {name}: running {stage['script']} (changes listed in {opts.changed_eins})")
+                elif opts.changed_eins and name not in forced and can_upsert(stage, parts, last, upserted, producers):
+                    mode = "upsert"
+                    print(f"▶️  {name}: updating the changed EINs with {stage['script']}")
+                    if not stage.get("incremental"):
+                        stage = {**stage, "args": [*stage.get("args", []), "--changed-eins", str(opts.changed_eins)]}
+                else:
+                    mode = "full"
+                    print(f"▶️  {name}: running {stage['script']}")
+                if name in refreshing:
+                    stage = {**stage, "args": [*stage.get("args", []), *refresh_args(opts)]}
+                before = {p: hashes.path(p) for p in stage["outputs"]} if mode == "upsert" else None
+                running[pool.submit(run_stage, stage)] = (name, key, parts, mode, before)
+                running_names.add(name)
+
+            if not running:
+                if not ready() and not blocked():
+                    break
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, key, parts, mode, before = running.pop(future)
+                running_names.discard(name)
+                code, wall, peak_mb = future.result()
+                entry = {"wall_s": round(wall, 3), "peak_mb": round(peak_mb, 1) if peak_mb is not None else None,
+                         "finished_at": utc_now(), "exit_code": code}
+                if code == 0:
+                    results[name] = "ran"
+                    if mode == "upsert":
+                        upserted[name] = before
+                    # Hash inputs as they were when the stage started (key), so edits made mid-run re-trigger it
+                    state["stages"][name] = {"key": key, "parts": parts, "mode": mode, **entry}
+                    print(f"🏁 {name}: done in {wall:.1f}s, peak {entry['peak_mb']} MB")
+                else:
+                    results[name] = "failed"
+                    state["stages"].setdefault(name, {})["last_failure"] = entry
+                    print(f"❌ {name}: exited with {code} after {wall:.1f}s")
+                hashes.prune()
+                state["hashes"] = hashes.entries
+                save_state(opts.state, state)
+
+    if not opts.dry_run:
+        # fetch_990_financials adds to the list on every run; empty it once every per-org
+        # stage has caught up, so the next run only carries the new changes
+        consumers = [stage["name"] for stage in stages if stage.get("by_ein")]
+        if all(results.get(name) in ("ran", "skipped") for name in consumers):
+            lists = {Path(stage["lists_changes"]) for stage in stages if stage.get("lists_changes")}
+            for path in sorted(lists | ({opts.changed_eins} if opts.changed_eins else set())):
+                if path.exists() and path.stat().st_size:
+                    path.write_text("")
+                    print(f"🧹 Cleared {path}: every per-org stage is up to date")
+        hashes.prune()
+        state["hashes"] = hashes.entries
+        save_state(opts.state, state)
+    return {name: results[name] for name in by_name if name in results}, state
+
+
+def print_summary(results, state):
+    print("\n📋 Stage           status    wall (s)  peak (MB)")
+    for name, status in results.items():
+        entry = state["stages"].get(name, {}) if status == "ran" else {}
+        wall = f"{entry['wall_s']:.1f}" if "wall_s" in entry else "-"
+        peak = entry.get("peak_mb") if entry.get("peak_mb") is not None else "-"
+        print(f"   {name:<22} {status:<9} {wall:>8}  {peak:>9}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the pipeline stages whose inputs changed")
+    parser.add_argument("stages", nargs="*", help="Stages to bring up to date (default: all), plus their upstream")
+    parser.add_argument("--only", action="store_true", help="Don't pull in upstream stages of the ones named")
+    parser.add_argument("--force", nargs="+", default=[], metavar="STAGE", help="Re-run these stages regardless of hashes ('all' for every stage)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Stages to run in parallel")
+    parser.add_argument("--state", type=Path, default=state_file)
+    parser.add_argument("--dry-run", action="store_true", help="Show which stages would run")
+    parser.add_argument("--changed-eins", type=Path, metavar="FILE",
+                        help="EINs whose filings changed (one per line): stages that can will update just those orgs")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Re-fetch cached filings too (fetch_990_financials.py --refresh); always runs that stage")
+    parser.add_argument("--ttl-days", type=float, help="With --refresh: only EINs fetched at least this long ago")
+    parser.add_argument("--due-only", action="store_true", help="With --refresh: only EINs whose next filing should be out")
+    parser.add_argument("--list", action="store_true", help="List stages with their inputs and outputs")
+    parser.add_argument("--perf-log", type=Path, metavar="FILE",
+                        help="Append each stage's step timings here as JSON lines (see scripts/perf.py)")
+    opts = parser.parse_args(argv)
+    if (opts.ttl_days is not None or opts.due_only) and not opts.refresh:
+        parser.error("--ttl-days / --due-only only apply with --refresh")
+    if opts.changed_eins and not opts.changed_eins.is_file():
+        parser.error(f"--changed-eins: {opts.changed_eins} not found (fetch_990_financials.py writes it)")
+    return opts
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+
+    if opts.list:
+        deps = stage_graph(STAGES)
+        for stage in STAGES:
+            after = ", ".join(sorted(deps[stage["name"]])) or "-"
+            print(f"🔧 {stage['name']} (after: {after})")
+            print(f"     in:  {', '.join(stage['inputs'])}")
+            print(f"     out: {', '.join(stage['outputs'])}")
+        return
+
+    # Stages inherit it and log through perf.script_tracer
+    if opts.perf_log:
+        os.environ["PERF_LOG"] = str(opts.perf_log.resolve())
+
+    results, state = run_pipeline(STAGES, opts)
+    print_summary(results, state)
+    if "failed" in results.values():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
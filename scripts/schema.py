@@ -0,0 +1,163 @@
+import numpy as np
+import pandas as pd
+
+# === Canonical column types ===
+# What every pipeline column is, wherever it appears (timeseries, momentum, mapped orgs,
+# profiles). Stages conform() what they write and the dashboard conform()s what it reads,
+# so a table has the same compact types whether it came from Parquet or a legacy CSV:
+#   - EIN and years are integers (nullable where the source can be blank)
+#   - repeated text (places, addresses, IRS codes, NTEE, sector/size/flag/class labels) is
+#     categorical; IRS codes stay text ("03" is not 3)
+#   - org names, which hardly repeat, are Arrow-backed strings
+#   - IS_* flags are nullable booleans, parsed from "True"/"False" text when needed
+#   - dollar amounts stay float64 (float32 is only exact to ~$16.7M); ratios and
+#     percentages, rounded to 2-3 decimals, become float32 with compact=True when small
+#     enough to keep those decimals
+# Columns not listed here (trajectory REV_<year> columns, scores, cube measures) are left alone.
+
+TEXT = "string[pyarrow]"
+
+COLUMN_TYPES = {
+    "EIN": "int64",
+    "YEAR": "Int32",
+    "PEAK_YEAR": "Int32",
+    "TROUGH_YEAR": "Int32",
+    "YEARS_UP": "int32",
+    "YEARS_DOWN": "int32",
+    "RULING": "Int32",
+    "TAX_PERIOD": "Int32",
+    "CLUSTER_ID": "Int16",
+
+    "NAME": TEXT,
+    "ORG_NAME": TEXT,
+
+    "ICO": "category",
+    "STREET": "category",
+    "SORT_NAME": "category",
+    "CITY": "category",
+    "STATE": "category",
+    "ZIP": "category",
+    "NTEE_CD": "category",
+    "GROUP": "category",
+    "SUBSECTION": "category",
+    "AFFILIATION": "category",
+    "CLASSIFICATION": "category",
+    "DEDUCTIBILITY": "category",
+    "FOUNDATION": "category",
+    "ACTIVITY": "category",
+    "ORGANIZATION": "category",
+    "STATUS": "category",
+    "ASSET_CD": "category",
+    "INCOME_CD": "category",
+    "FILING_REQ_CD": "category",
+    "PF_FILING_REQ_CD": "category",
+    "ACCT_PD": "category",
+    "SECTOR": "category",
+    "SIZE_BUCKET": "category",
+    "MOMENTUM_CLASS": "category",
+    "TARGET_FLAG": "category",
+
+    "IS_HOLLOW": "boolean",
+    "IS_TURBULENT": "boolean",
+
+    "ASSET_AMT": "float64",
+    "INCOME_AMT": "float64",
+    "REVENUE_AMT": "float64",
+    "REVENUE": "float64",
+    "EXPENSES": "float64",
+    "ASSETS": "float64",
+    "PROGRAM_REVENUE": "float64",
+    "CONTRIBUTIONS": "float64",
+    "AVG_RECENT_REVENUE": "int64",
+    "AVG_PRIOR_REVENUE": "int64",
+    "MOMENTUM_SCORE": "float64",
+
+    "PCT_CHANGE": "float64",
+    "VOLATILITY": "float64",
+    "PROGRAM_PCT": "float64",
+    "CAGR": "float64",
+    "REBOUND_RATE": "float64",
+}
+
+# Downcast to float32 by conform(compact=True): ratios stored at 2-3 decimals. float32
+# holds ~7 significant digits, so only columns entirely below FLOAT32_LIMIT qualify
+# (PCT_CHANGE, for one, has outliers in the millions of percent).
+COMPACT_FLOATS = {"PCT_CHANGE", "VOLATILITY", "PROGRAM_PCT", "CAGR", "REBOUND_RATE"}
+FLOAT32_LIMIT = 10_000
+
+_TRUE = {"true", "1", "yes"}
+_FALSE = {"false", "0", "no"}
+
+
+def csv_dtypes():
+    # read_csv dtypes that keep text columns as text (ZIPs and IRS codes keep leading zeros);
+    # conform() then builds the categoricals, which is leaner than read_csv's own
+    return {col: str for col, dtype in COLUMN_TYPES.items() if dtype in ("category", TEXT)}
+
+
+def _to_boolean(series, col):
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype("boolean")
+    text = series.astype("string").str.strip().str.lower()
+    unknown = text.notna() & ~text.isin(_TRUE | _FALSE)
+    if unknown.any():
+        raise ValueError(f"{col}: not a true/false value: {text[unknown].iloc[0]!r}")
+    return text.isin(_TRUE).astype("boolean").mask(text.isna())
+
+
+def _to_number(series, col, dtype):
+    if not pd.api.types.is_numeric_dtype(series) or pd.api.types.is_bool_dtype(series):
+        try:
+            series = pd.to_numeric(series.astype("string").str.strip(), errors="raise")
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"{col}: can't read as {dtype}: {e}") from None
+
+    kind = np.dtype(dtype.lower()).kind
+    if kind in "iu":
+        if dtype[0].islower() and series.isna().any():
+            raise ValueError(f"{col}: has missing values, can't store as {dtype}")
+        values = series.dropna()
+        if len(values) and (values % 1 != 0).any():
+            raise ValueError(f"{col}: has fractional values, can't store as {dtype}")
+        info = np.iinfo(dtype.lower())
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            raise ValueError(f"{col}: values out of range for {dtype}")
+    return series.astype(dtype)
+
+
+def _fits_float32(series):
+    values = pd.to_numeric(series, errors="coerce")
+    return not (values.abs() >= FLOAT32_LIMIT).any()
+
+
+def conform(df, compact=False):
+    # Returns `df` with every known column cast to its canonical type; raises ValueError
+    # naming the column when a value can't be represented. compact=True also downcasts
+    # the ratio columns to float32 (for tables held in memory; files keep float64).
+    types = {}
+    for col in df.columns:
+        dtype = COLUMN_TYPES.get(col)
+        if dtype is None:
+            continue
+        if compact and col in COMPACT_FLOATS and _fits_float32(df[col]):
+            dtype = "float32"
+        if df[col].dtype != dtype:
+            types[col] = dtype
+    if not types:
+        return df
+
+    df = df.copy(deep=False)
+    for col, dtype in types.items():
+        if dtype == "category":
+            df[col] = df[col].astype("category")
+        elif dtype == TEXT:
+            df[col] = df[col].astype(TEXT)
+        elif dtype == "boolean":
+            df[col] = _to_boolean(df[col], col)
+        else:
+            df[col] = _to_number(df[col], col, dtype)
+    return df
+
+
+def memory_mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
@@ -1,48 +1,70 @@
-import pandas as pd
+import argparse
 from pathlib import Path
 
-input_file = Path("data/processed/org_master_profiles.csv")
-output_file = Path("data/processed/org_master_profiles_scored.csv")
+from cubes import build_cube, cube_file
+from perf import script_tracer
+from schema import conform, csv_dtypes
+from scoring import apply_scoring, load_rules, rules_file
+from storage import in_order, incremental_eins, read_table, resolve, upsert_rows, write_table
 
-df = pd.read_csv(input_file)
+input_file = Path("data/processed/org_master_profiles.parquet")
+output_file = Path("data/processed/org_master_profiles_scored.parquet")
+clusters_file = Path("data/processed/org_clusters.parquet")
 
-def calculate_score(row):
-    score = 0
 
-    if row.get("IS_HOLLOW") is True or str(row.get("IS_HOLLOW")).lower() == "true":
-        score += 40
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Score org master profiles with the configured rules")
+    parser.add_argument("--input", type=Path, default=input_file)
+    parser.add_argument("--output", type=Path, default=output_file)
+    parser.add_argument("--rules", type=Path, default=rules_file, help="Scoring rules and flag cutoffs (JSON)")
+    parser.add_argument("--cube", type=Path, default=cube_file, help="Pre-aggregated chart cube for the dashboard")
+    parser.add_argument("--clusters", type=Path, default=clusters_file, help="CLUSTER_ID per EIN from cluster_orgs.py (skipped if missing)")
+    parser.add_argument("--changed-eins", type=Path, help="Only re-score these EINs (one per line) and upsert them into --output")
+    return parser.parse_args(argv)
 
-    if row.get("IS_TURBULENT") is True or str(row.get("IS_TURBULENT")).lower() == "true":
-        score += 30
 
-    momentum = str(row.get("MOMENTUM_CLASS", "")).lower()
-    if "down" in momentum:
-        score += 20
-    elif "turbulent" in momentum:
-        score += 10
+def main(argv=None):
+    opts = parse_args(argv)
+    tracer = script_tracer("score_targets", incremental=bool(opts.changed_eins))
 
-    size = str(row.get("SIZE_BUCKET", "")).lower()
-    if size == "medium":
-        score += 10
-    elif size == "large":
-        score += 15
-    elif size == "major":
-        score += 20
+    eins, filters = incremental_eins(opts.changed_eins, opts.output)
+    if eins == []:
+        return
 
-    return score
+    df = conform(read_table(opts.input, csv_dtype=csv_dtypes(), filters=filters))
+    rules = load_rules(opts.rules)
+    tracer.mark("load", rows=len(df))
 
-def assign_flag(score):
-    if score >= 70:
-        return "high_priority"
-    elif score >= 50:
-        return "watchlist"
-    elif score >= 30:
-        return "low_priority"
-    else:
-        return "not_a_fit"
+    # === Cluster assignments (optional) ===
+    clusters = None
+    if resolve(opts.clusters).exists():
+        clusters = conform(read_table(opts.clusters, columns=["EIN", "CLUSTER_ID"])).set_index("EIN")["CLUSTER_ID"]
+        df = df.join(clusters, on="EIN", how="left")
 
-df["PRIORITY_SCORE"] = df.apply(calculate_score, axis=1)
-df["TARGET_FLAG"] = df["PRIORITY_SCORE"].apply(assign_flag)
+    df = apply_scoring(df, rules)
+    tracer.mark("score", rows=len(df))
 
-df.to_csv(output_file, index=False)
-print(f"✅ Saved scored file to {output_file}")
\ No newline at end of file
+    # Re-scored orgs replace their old rows, in the profiles' order; cluster ids are
+    # re-attached for everyone in case the clustering was refitted
+    if eins is not None:
+        print(f"🔁 Re-scored {len(df)} orgs for {len(eins)} changed EINs")
+        df = upsert_rows(conform(read_table(opts.output)), conform(df), eins)
+        df = in_order(df, conform(read_table(opts.input, columns=["EIN"], csv_dtype=csv_dtypes()))["EIN"])
+        if clusters is not None:
+            df["CLUSTER_ID"] = df["EIN"].map(clusters)
+        tracer.mark("upsert", rows=len(df))
+
+    df = conform(df)
+    write_table(df, opts.output)
+    print(f"✅ Saved scored file to {opts.output}")
+    tracer.mark("save", rows=len(df))
+
+    # === Chart cube for the dashboard (always over every org) ===
+    cube = build_cube(df)
+    write_table(cube, opts.cube)
+    print(f"🧊 Saved chart cube ({len(cube)} cells for {len(df)} orgs) to {opts.cube}")
+    tracer.mark("chart cube", rows=len(cube))
+
+
+if __name__ == "__main__":
+    main()
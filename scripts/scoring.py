@@ -0,0 +1,113 @@
+import copy
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+rules_file = Path("data/scoring_rules.json")
+
+# === Rule types (see data/scoring_rules.json) ===
+#   flag      adds `weight` when the column is True (or, for untyped text, "true")
+#   equals    adds the weight of the case matching the lowercased value exactly
+#   contains  adds the weight of the FIRST case (in file order) found in the lowercased value
+#
+# Every rule compiles to one 0/1 feature column per case, so a score is just
+# features @ weights and a weight change never touches the per-row data again.
+
+
+def load_rules(path=rules_file):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def feature_weights(rules):
+    # [(feature name, weight)] in the same order as the compiled feature columns
+    out = []
+    for rule in rules["rules"]:
+        if rule["type"] == "flag":
+            out.append((rule["name"], rule["weight"]))
+        else:
+            out.extend((f"{rule['name']}:{key}", weight) for key, weight in rule["cases"].items())
+    return out
+
+
+def _rule_matrix(series, rule):
+    if rule["type"] == "flag" and pd.api.types.is_bool_dtype(series):
+        return series.fillna(False).to_numpy(dtype=np.uint8)[:, None]
+
+    # Match against each distinct value once, then broadcast to rows through the codes
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    lowered = pd.Index([str(v).lower() for v in uniques], dtype=object)
+
+    if rule["type"] == "flag":
+        hits = [lowered == "true"]
+    elif rule["type"] == "equals":
+        hits = [lowered == key for key in rule["cases"]]
+    elif rule["type"] == "contains":
+        hits = []
+        taken = np.zeros(len(lowered), dtype=bool)
+        for key in rule["cases"]:
+            hit = np.asarray(lowered.str.contains(key, regex=False), dtype=bool) & ~taken
+            taken |= hit
+            hits.append(hit)
+    else:
+        raise ValueError(f"Unknown scoring rule type: {rule['type']!r}")
+
+    return np.column_stack(hits).astype(np.uint8)[codes]
+
+
+def compile_features(df, rules):
+    # Returns an (orgs x features) 0/1 matrix aligned with feature_weights(rules)
+    blocks = []
+    for rule in rules["rules"]:
+        width = 1 if rule["type"] == "flag" else len(rule["cases"])
+        if rule["column"] in df.columns:
+            blocks.append(_rule_matrix(df[rule["column"]], rule))
+        else:
+            blocks.append(np.zeros((len(df), width), dtype=np.uint8))
+    if not blocks:
+        return np.zeros((len(df), 0), dtype=np.uint8)
+    return np.hstack(blocks)
+
+
+def weight_vector(rules):
+    return np.array([w for _, w in feature_weights(rules)], dtype=np.float64)
+
+
+def score(features, weights):
+    scores = features @ weights
+    if np.all(np.mod(weights, 1) == 0):
+        scores = scores.astype(np.int64)
+    return scores
+
+
+def assign_flags(scores, rules):
+    cutoffs = sorted(rules["flags"].items(), key=lambda kv: kv[1], reverse=True)
+    return np.select(
+        [scores >= cutoff for _, cutoff in cutoffs],
+        [flag for flag, _ in cutoffs],
+        default=rules["default_flag"],
+    )
+
+
+def apply_scoring(df, rules, features=None):
+    # Pass precompiled `features` to re-score the same frame with different weights
+    if features is None:
+        features = compile_features(df, rules)
+    scores = score(features, weight_vector(rules))
+    return df.assign(PRIORITY_SCORE=scores, TARGET_FLAG=assign_flags(scores, rules))
+
+
+def with_weights(rules, weights=None, flags=None):
+    # Copy of `rules` with feature weights ({feature name: weight}) and/or flag cutoffs replaced
+    rules = copy.deepcopy(rules)
+    for rule in rules["rules"]:
+        if rule["type"] == "flag":
+            rule["weight"] = (weights or {}).get(rule["name"], rule["weight"])
+        else:
+            for key in rule["cases"]:
+                rule["cases"][key] = (weights or {}).get(f"{rule['name']}:{key}", rule["cases"][key])
+    if flags:
+        rules["flags"].update(flags)
+    return rules
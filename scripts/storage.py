@@ -0,0 +1,231 @@
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from perf import timed
+
+# === Intermediate table store ===
+# Stages hand tables to each other as typed Parquet: numbers stay numbers, categorical
+# columns (see schema.py) are stored dictionary-encoded and read back as categoricals, and reads
+# can project columns and push filters down to the row groups. CSV is for export only;
+# the one exception is reading a table that so far only exists as a CSV (data committed
+# before the switch), which read_table falls back to transparently.
+#
+# Filters use the pyarrow form: [(col, op, value), ...] ANDed together, or a list of such
+# lists ORed together. ops: == = != < <= > >= in "not in"
+
+
+def resolve(path):
+    # The file read_table(path) would actually read: the Parquet table, else its CSV sibling
+    path = Path(path)
+    if path.suffix == ".parquet" and not path.exists() and path.with_suffix(".csv").exists():
+        return path.with_suffix(".csv")
+    return path
+
+
+@timed()
+def write_table(df, path, row_group_size=None):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.suffix == ".csv":
+        df.to_csv(path, index=False)
+        return path
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Write next to the target and swap in, so readers never see a half-written table
+    tmp = path.with_suffix(".parquet.tmp")
+    pq.write_table(table, tmp, row_group_size=row_group_size)
+    os.replace(tmp, path)
+    return path
+
+
+class TableWriter:
+    # Appends DataFrame chunks to one table without holding them all in memory
+    # (a Parquet row group per chunk). Nothing appears at `path` until close().
+    def __init__(self, path, schema=None):
+        self.path = Path(path)
+        self.schema = schema
+        self.tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        self.rows = 0
+        self._writer = None
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, df):
+        if self.path.suffix == ".csv":
+            df.to_csv(self.tmp, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        else:
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.tmp, table.schema)
+            self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self, keep=True):
+        if self._writer is not None:
+            self._writer.close()
+        if keep and self.tmp.exists():
+            os.replace(self.tmp, self.path)
+        elif self.tmp.exists():
+            self.tmp.unlink()
+
+
+@timed()
+def read_table(path, columns=None, filters=None, csv_dtype=None):
+    path = resolve(path)
+    if path.suffix != ".csv":
+        return pd.read_parquet(path, columns=columns, filters=filters)
+
+    # CSV fallback: no pushdown, so load what the filters need and apply them here
+    usecols = None
+    if columns is not None:
+        usecols = list(dict.fromkeys([*columns, *_filter_columns(filters)]))
+    df = pd.read_csv(path, usecols=usecols, dtype=csv_dtype, low_memory=False)
+    if filters:
+        df = df[_filter_mask(df, filters)].reset_index(drop=True)
+    return df[columns] if columns is not None else df
+
+
+def _clauses(filters):
+    # Normalise to a list of AND-groups
+    if filters and isinstance(filters[0], tuple):
+        return [filters]
+    return filters or []
+
+
+def _filter_columns(filters):
+    return [col for group in _clauses(filters) for col, _, _ in group]
+
+
+def _filter_mask(df, filters):
+    mask = pd.Series(False, index=df.index)
+    for group in _clauses(filters):
+        hit = pd.Series(True, index=df.index)
+        for col, op, value in group:
+            values = df[col]
+            if op in ("==", "="):
+                hit &= values == value
+            elif op == "!=":
+                hit &= values != value
+            elif op == "<":
+                hit &= values < value
+            elif op == "<=":
+                hit &= values <= value
+            elif op == ">":
+                hit &= values > value
+            elif op == ">=":
+                hit &= values >= value
+            elif op == "in":
+                hit &= values.isin(value)
+            elif op == "not in":
+                hit &= ~values.isin(value)
+            else:
+                raise ValueError(f"Unsupported filter op: {op!r}")
+        mask |= hit.fillna(False).astype(bool)
+    return mask
+
+
+# === Incremental updates ===
+# Every per-org metric depends only on that EIN's own rows, so after a filing refresh a
+# stage can recompute just the EINs fetch_990_financials.py listed as changed and swap
+# their rows into its existing output.
+
+
+def read_eins(path):
+    # EINs listed one per line (zero-padded or not), as sorted unique ints
+    with open(path, "r") as f:
+        return sorted({int(line) for line in f if line.strip()})
+
+
+def incremental_eins(path, output):
+    # (eins, read filters) for a stage given --changed-eins: (None, None) means run in full
+    # (no list, or no output to update yet); [] means nothing changed
+    eins = read_eins(path) if path and Path(output).exists() else None
+    if eins == []:
+        print(f"✅ No changed EINs, {output} is up to date")
+    return eins, ([("EIN", "in", eins)] if eins is not None else None)
+
+
+@timed()
+def upsert_rows(old, new, eins, key="EIN"):
+    # `old` minus every row for `eins`, plus `new` (their recomputed rows, possibly none)
+    kept = old[~old[key].isin(eins)]
+    if new.empty:
+        return kept.reset_index(drop=True)
+    return pd.concat([kept, new], ignore_index=True)
+
+
+def in_order(df, order, key="EIN"):
+    # Rows of `df` in the order their keys first appear in `order` (stable within a key);
+    # rows whose key isn't in `order` are dropped
+    position = pd.Index(pd.unique(order)).get_indexer(df[key])
+    kept = np.flatnonzero(position >= 0)
+    return df.iloc[kept[position[kept].argsort(kind="stable")]].reset_index(drop=True)
+
+
+# === Memory-mapped snapshots ===
+# A read-only copy of a table as an uncompressed Arrow IPC file, for long-lived readers
+# (the dashboard). Mapping it instead of reading it means numbers and strings are used in
+# place: every process and session on the host shares one copy through the page cache.
+
+
+@timed()
+def write_snapshot(df, path):
+    path = Path(path)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = path.with_suffix(f"{path.suffix}.{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp), "wb") as f, pa.ipc.new_file(f, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+    return path
+
+
+@timed()
+def map_snapshot(path):
+    # DataFrame over the mapped file: numeric columns without nulls and string columns
+    # point into the mapping (read-only); categorical codes, booleans and nullable ints
+    # are small copies
+    table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+    columns = {}
+    for name, col in zip(table.column_names, table.columns):
+        kind = col.type
+        if col.num_chunks == 1 and col.null_count == 0 and (pa.types.is_integer(kind) or pa.types.is_floating(kind)):
+            columns[name] = col.chunk(0).to_numpy()
+        elif pa.types.is_string(kind) or pa.types.is_large_string(kind):
+            columns[name] = pd.array(col, dtype=pd.StringDtype("pyarrow"))
+        else:
+            columns[name] = col.to_pandas()
+    return pd.DataFrame(columns, copy=False)
+
+
+def export_csv(path, csv_path=None):
+    # Stream a Parquet table out to CSV one row group at a time
+    path = Path(path)
+    csv_path = Path(csv_path) if csv_path else path.with_suffix(".csv")
+    parquet = pq.ParquetFile(path)
+    with open(csv_path, "w", newline="") as f:
+        for i, batch in enumerate(parquet.iter_batches()):
+            batch.to_pandas().to_csv(f, header=i == 0, index=False)
+    return csv_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export pipeline tables to CSV")
+    parser.add_argument("tables", nargs="+", type=Path, help="Parquet tables, e.g. data/processed/org_master_profiles_scored.parquet")
+    parser.add_argument("--out-dir", type=Path, default=None, help="Where to write the CSVs (default: next to each table)")
+    opts = parser.parse_args(argv)
+
+    if opts.out_dir:
+        opts.out_dir.mkdir(parents=True, exist_ok=True)
+    for table in opts.tables:
+        out = opts.out_dir / table.with_suffix(".csv").name if opts.out_dir else None
+        csv_path = export_csv(table, out)
+        print(f"📄 Exported {table} to {csv_path}")
+
+
+if __name__ == "__main__":
+    main()
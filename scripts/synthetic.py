@@ -0,0 +1,135 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# === Synthetic inputs for benchmarks ===
+# Shapes and value ranges follow the real inputs closely enough to exercise the same code
+# paths (blank NTEE codes and incomes, ZIP+4s, missing years, duplicate filings, orgs
+# ProPublica doesn't know), but every value is random. EINs start at 100000000 so they
+# survive every join without zero-padding issues.
+
+BMF_COLUMNS = [
+    "EIN", "NAME", "ICO", "STREET", "CITY", "STATE", "ZIP", "GROUP", "SUBSECTION", "AFFILIATION",
+    "CLASSIFICATION", "RULING", "DEDUCTIBILITY", "FOUNDATION", "ACTIVITY", "ORGANIZATION", "STATUS",
+    "TAX_PERIOD", "ASSET_CD", "INCOME_CD", "FILING_REQ_CD", "PF_FILING_REQ_CD", "ACCT_PD",
+    "ASSET_AMT", "INCOME_AMT", "REVENUE_AMT", "NTEE_CD", "SORT_NAME",
+]
+CITIES = ["PITTSBURGH", "MCKEESPORT", "MONROEVILLE", "BELLEVUE", "WILKINSBURG", "ERIE", "HARRISBURG", "ALTOONA"]
+FIRST_EIN = 100_000_000
+
+
+def eins_for(n):
+    return np.arange(FIRST_EIN, FIRST_EIN + n, dtype=np.int64)
+
+
+def _amounts(rng, n, blank=0.0):
+    values = pd.Series(np.round(rng.lognormal(12, 2.2, n)).astype(np.int64).astype(str))
+    return values.mask(rng.random(n) < blank)
+
+
+def make_bmf(n, seed=0, local_share=0.85):
+    # EO BMF rows for `n` PA orgs; about `local_share` of them fall in Allegheny ZIPs
+    rng = np.random.default_rng(seed)
+    eins = eins_for(n)
+    local = rng.random(n) < local_share
+    zips = np.where(local, rng.integers(15201, 15299, n), rng.integers(16001, 19699, n)).astype(str)
+    plus4 = rng.random(n) < 0.3
+    zips = np.where(plus4, np.char.add(zips, "-1234"), zips)
+
+    letters = np.array(list("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    ntee = np.char.add(rng.choice(letters, n), rng.integers(10, 99, n).astype(str))
+    ntee = pd.Series(ntee).mask(rng.random(n) < 0.1)
+
+    df = pd.DataFrame({col: pd.Series([None] * n, dtype=object) for col in BMF_COLUMNS})
+    df["EIN"] = pd.Series(eins).astype(str).str.zfill(9)
+    df["NAME"] = "SYNTHETIC ORG " + pd.Series(eins).astype(str)
+    df["STREET"] = rng.integers(1, 9999, n).astype(str)
+    df["CITY"] = rng.choice(CITIES, n)
+    df["STATE"] = "PA"
+    df["ZIP"] = zips
+    df["SUBSECTION"] = rng.choice(["03", "04", "06"], n)
+    df["RULING"] = rng.integers(1950, 2023, n).astype(str)
+    df["FOUNDATION"] = rng.choice(["15", "16", "10"], n)
+    df["ASSET_AMT"] = _amounts(rng, n, blank=0.15)
+    df["INCOME_AMT"] = _amounts(rng, n, blank=0.15)
+    df["REVENUE_AMT"] = _amounts(rng, n, blank=0.15)
+    df["NTEE_CD"] = ntee
+    return df
+
+
+def make_timeseries(eins, seed=0, last_year=2023):
+    # Flattened filings (financial_timeseries.parquet layout) for `eins`: 1-15 years each
+    # ending in `last_year`, noisy around a lognormal base, with gaps, zero/negative/missing
+    # revenue and a few duplicate years
+    rng = np.random.default_rng(seed)
+    n = len(eins)
+    sizes = rng.integers(1, 16, n)
+    ein = np.repeat(eins, sizes)
+    offset = np.arange(len(ein)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    year = (last_year - np.repeat(sizes, sizes) + 1 + offset).astype(np.int32)
+
+    base = np.repeat(rng.lognormal(12, 2, n), sizes)
+    revenue = np.round(base * rng.lognormal(0, 0.3, len(ein)))
+    revenue[rng.random(len(ein)) < 0.03] = 0
+    negative = rng.random(len(ein)) < 0.01
+    revenue[negative] = -revenue[negative]
+    revenue[rng.random(len(ein)) < 0.02] = np.nan
+
+    df = pd.DataFrame({
+        "EIN": ein,
+        "ORG_NAME": pd.Series(ein).map("Synthetic Org {}".format),
+        "YEAR": year,
+        "REVENUE": revenue,
+        "EXPENSES": np.round(revenue * rng.uniform(0.7, 1.1, len(ein))),
+        "ASSETS": np.round(base * rng.uniform(0.5, 3, len(ein))),
+        "PROGRAM_REVENUE": np.round(np.abs(revenue) * rng.uniform(0, 1, len(ein))),
+        "CONTRIBUTIONS": np.round(np.abs(revenue) * rng.uniform(0, 0.5, len(ein))),
+    })
+    df = df[rng.random(len(df)) >= 0.05]  # gaps
+    dup = df[rng.random(len(df)) < 0.01].assign(REVENUE=lambda d: np.round(d["REVENUE"] * 1.1))
+    df = pd.concat([df, dup], ignore_index=True)
+
+    program_pct = (df["PROGRAM_REVENUE"] / df["REVENUE"] * 100).round(2)
+    df["PROGRAM_PCT"] = program_pct.where(df["REVENUE"] > 0)
+    return df.sort_values(["EIN", "YEAR"], kind="stable").reset_index(drop=True)
+
+
+def write_corpus(timeseries, out_dir, eins=None, not_found_share=0.03, seed=0):
+    # One ProPublica-style JSON per EIN (the layout fetch_990_financials.py caches). EINs in
+    # `eins` without filings, plus a random `not_found_share`, get ProPublica's 404 body.
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    fields = {
+        "tax_prd_yr": "YEAR", "totrevenue": "REVENUE", "totfuncexpns": "EXPENSES",
+        "totassetsend": "ASSETS", "totprgmrevnue": "PROGRAM_REVENUE", "totcntrbgfts": "CONTRIBUTIONS",
+    }
+    not_found = b'{"error": "Not Found"}'
+
+    ts = timeseries.sort_values("EIN", kind="stable")
+    ein = ts["EIN"].to_numpy()
+    starts = np.flatnonzero(np.r_[True, ein[1:] != ein[:-1]])
+    ends = np.r_[starts[1:], len(ein)]
+    # Whole-dollar ints (None for missing) for every filing, built once
+    values = ts[list(fields.values())].round().astype("Int64").astype(object)
+    rows = values.where(values.notna(), None).to_numpy().tolist()
+    names = ts["ORG_NAME"].to_numpy()
+    keys = list(fields)
+
+    written = 0
+    for start, end in zip(starts, ends):
+        path = out_dir / f"{ein[start]}.json"
+        if rng.random() < not_found_share:
+            path.write_bytes(not_found)
+        else:
+            filings = [dict(zip(keys, row)) for row in rows[start:end]]
+            body = {"organization": {"name": names[start]}, "filings_with_data": filings}
+            path.write_text(json.dumps(body))
+        written += 1
+
+    for ein in set(eins if eins is not None else []) - set(ein.tolist()):
+        (out_dir / f"{ein}.json").write_bytes(not_found)
+        written += 1
+    return written
@@ -0,0 +1,178 @@
+import argparse
+import itertools
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from perf import timed
+from schema import conform, csv_dtypes
+from scoring import compile_features, feature_weights, load_rules, rules_file, score
+from storage import read_table
+
+input_file = Path("data/processed/org_master_profiles.parquet")
+
+# === What-if scoring ===
+# Scores many weight / cutoff configurations at once against the baseline rules.
+# A config is a dict of overrides, {feature name or flag: value}, e.g.
+#   {"hollow": 50, "high_priority": 65}
+# Features are 0/1, so orgs collapse to a few dozen distinct feature rows ("patterns").
+# Every config is then one column of a weight matrix, and
+#   patterns (P x features) @ weights (features x configs)
+# scores all of them in one product; flag counts are the pattern counts summed per
+# cutoff. Only the top-N leaderboard goes back to org rows, and only for the orgs
+# at the tie line.
+
+
+def config_grid(ranges):
+    # Every combination of {param: [values]}, as a list of override dicts
+    names = list(ranges)
+    return [dict(zip(names, values)) for values in itertools.product(*(ranges[name] for name in names))]
+
+
+def parse_range(text):
+    # "30:60:5" (inclusive) or "40,50,60"
+    if ":" in text:
+        start, stop, step = (float(part) for part in text.split(":"))
+        values = np.arange(start, stop + step / 2, step)
+    else:
+        values = [float(part) for part in text.split(",")]
+    return [int(v) if float(v).is_integer() else float(v) for v in values]
+
+
+class ScoreSweep:
+    def __init__(self, features, rules):
+        self.rules = rules
+        self.n = len(features)
+        self.feature_names = [name for name, _ in feature_weights(rules)]
+        self.base_weights = np.array([w for _, w in feature_weights(rules)], dtype=np.float64)
+        self.flags = list(rules["flags"])
+        self.base_cutoffs = np.array([rules["flags"][flag] for flag in self.flags], dtype=np.float64)
+
+        # Distinct feature rows (deduplicated as packed bytes), how many orgs have each,
+        # and each pattern's orgs in file order
+        packed = np.ascontiguousarray(np.packbits(features, axis=1))
+        keys = packed.view(np.dtype((np.void, packed.shape[1]))).reshape(-1)
+        _, first, inverse, self.counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+        self.patterns = features[first]
+        self.inverse = inverse.reshape(-1)
+        order = np.argsort(self.inverse, kind="stable")
+        self.members = np.split(order, np.cumsum(self.counts)[:-1])
+
+    def _matrices(self, configs):
+        weights = np.repeat(self.base_weights[:, None], len(configs), axis=1)
+        cutoffs = np.repeat(self.base_cutoffs[:, None], len(configs), axis=1)
+        for j, config in enumerate(configs):
+            for name, value in config.items():
+                if name in self.feature_names:
+                    weights[self.feature_names.index(name), j] = value
+                elif name in self.flags:
+                    cutoffs[self.flags.index(name), j] = value
+                else:
+                    raise ValueError(f"Unknown scoring weight or flag: {name!r}")
+        return weights, cutoffs
+
+    def flag_counts(self, scores, cutoffs):
+        # (flags + default) x configs org counts; like scoring.assign_flags, an org gets
+        # the highest cutoff it reaches, and equal cutoffs go to the flag listed first
+        order = np.argsort(-cutoffs, axis=0, kind="stable")
+        ranked_cutoffs = np.take_along_axis(cutoffs, order, axis=0)
+        reached = np.einsum("p,pkc->kc", self.counts, scores[:, None, :] >= ranked_cutoffs[None, :, :])
+        exclusive = np.diff(reached, axis=0, prepend=0)
+        counts = np.empty_like(exclusive)
+        np.put_along_axis(counts, order, exclusive, axis=0)
+        return np.vstack([counts, self.n - reached[-1:]])
+
+    def top(self, pattern_scores, top_n):
+        # Org positions of the top_n by score (highest first, ties in file order),
+        # matching the dashboard table's ranking (table_view.score_rank)
+        top_n = min(top_n, self.n)
+        if top_n == 0:
+            return np.zeros(0, dtype=np.int64)
+        levels = np.unique(pattern_scores)[::-1]
+        taken = []
+        remaining = top_n
+        for level in levels:
+            tied = np.flatnonzero(pattern_scores == level)
+            if self.counts[tied].sum() <= remaining:
+                rows = np.concatenate([self.members[p] for p in tied])
+            else:
+                rows = np.concatenate([self.members[p][:remaining] for p in tied])
+            taken.append(np.sort(rows)[:remaining])
+            remaining -= len(taken[-1])
+            if remaining == 0:
+                break
+        return np.concatenate(taken)
+
+    @timed()
+    def run(self, configs, top_n=50, baseline=None):
+        # One row per config: its overrides, org count per flag (upper-cased, so a swept
+        # cutoff keeps its own column) and how many of the baseline's top_n stay in its
+        # top_n. `baseline` is an override dict too (default: the rules as loaded).
+        weights, cutoffs = self._matrices(configs)
+        scores = self.patterns @ weights
+        counts = self.flag_counts(scores, cutoffs)
+
+        base_top = self.top(self.pattern_scores(baseline), top_n)
+        kept = [len(np.intersect1d(self.top(scores[:, j], top_n), base_top)) for j in range(len(configs))]
+
+        result = pd.DataFrame(configs, index=range(len(configs)))
+        for i, flag in enumerate(self.flags + [self.rules["default_flag"]]):
+            result[flag.upper()] = counts[i]
+        result["TOP_N_KEPT"] = kept
+        result["TOP_N_NEW"] = len(base_top) - np.array(kept, dtype=np.int64)
+        return result
+
+    def pattern_scores(self, config=None):
+        weights, _ = self._matrices([config or {}])
+        return score(self.patterns, weights[:, 0])
+
+    def org_scores(self, config, rows):
+        return self.pattern_scores(config)[self.inverse[rows]]
+
+    def baseline_counts(self, baseline=None):
+        weights, cutoffs = self._matrices([baseline or {}])
+        counts = self.flag_counts(self.patterns @ weights, cutoffs)
+        return dict(zip(self.flags + [self.rules["default_flag"]], counts[:, 0].tolist()))
+
+    def leaderboard_changes(self, config, top_n=50, baseline=None):
+        # Positions entering and leaving the top_n under `config`, each in rank order
+        top = self.top(self.pattern_scores(config), top_n)
+        base_top = self.top(self.pattern_scores(baseline), top_n)
+        return top[~np.isin(top, base_top)], base_top[~np.isin(base_top, top)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep scoring weights / flag cutoffs and report how targets shift")
+    parser.add_argument("--input", type=Path, default=input_file)
+    parser.add_argument("--rules", type=Path, default=rules_file, help="Baseline scoring rules (JSON)")
+    parser.add_argument("--vary", action="append", default=[], metavar="NAME=RANGE",
+                        help="Weight (e.g. hollow, size:large) or flag cutoff to sweep, as START:STOP:STEP or a,b,c")
+    parser.add_argument("--top", type=int, default=50, help="Leaderboard size to compare against the baseline")
+    parser.add_argument("--output", type=Path, help="Also write the results to this CSV")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+
+    rules = load_rules(opts.rules)
+    df = conform(read_table(opts.input, csv_dtype=csv_dtypes()))
+    sweep = ScoreSweep(compile_features(df, rules), rules)
+
+    ranges = {}
+    for item in opts.vary:
+        name, _, values = item.partition("=")
+        ranges[name] = parse_range(values)
+    configs = config_grid(ranges)
+
+    result = sweep.run(configs, top_n=opts.top)
+    print(f"⚖️ Baseline flag counts: {sweep.baseline_counts()}")
+    print(result.to_string(index=False))
+    if opts.output:
+        result.to_csv(opts.output, index=False)
+        print(f"✅ Saved {len(result)} configs to {opts.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import json
+import math
+from pathlib import Path
+
+# === ZIP map layer ===
+# The dashboard side of build_zip_layer.py: its GeoJSON layers (one per zoom level,
+# coarse to fine, already simplified and joined to ZIP5) are loaded once per data version
+# and indexed by ZIP, so drawing the map for the current filters is only picking features
+# out of a dict. build_zip_layer.py writes its layers to the names defined here.
+
+LEVELS = ["coarse", "medium", "fine"]
+VERTEX_BUDGET = 150_000  # vertices sent to the browser per map
+
+
+def layer_file(directory, level):
+    return Path(directory) / f"zip_layer_{level}.geojson"
+
+
+class ZipLayer:
+    def __init__(self, directory):
+        self.features = {}
+        self.vertices = {}
+        self.bbox = {}
+        for level in LEVELS:
+            with open(layer_file(directory, level), "r") as f:
+                collection = json.load(f)
+            self.features[level] = {}
+            self.vertices[level] = {}
+            for feature in collection["features"]:
+                props = feature["properties"]
+                code = props["ZIP"]
+                # Plotly only needs the id and the shape; the numbers come from the filtered orgs
+                self.features[level][code] = {"type": "Feature", "properties": {"ZIP": code}, "geometry": feature["geometry"]}
+                self.vertices[level][code] = props["VERTICES"]
+                self.bbox[code] = feature["bbox"]
+
+    def __len__(self):
+        return len(self.bbox)
+
+    def mapped(self, zips):
+        # The ZIPs among `zips` that have a boundary
+        return [code for code in zips if code in self.bbox]
+
+    def level_for(self, zips, budget=VERTEX_BUDGET):
+        # Finest level whose shapes for `zips` stay within the vertex budget
+        for level in reversed(LEVELS[1:]):
+            if sum(self.vertices[level][code] for code in zips) <= budget:
+                return level
+        return LEVELS[0]
+
+    def geojson(self, zips, level):
+        return {"type": "FeatureCollection", "features": [self.features[level][code] for code in zips]}
+
+    def view(self, zips):
+        # Map centre and zoom that fit `zips`
+        boxes = [self.bbox[code] for code in zips]
+        west, south = min(b[0] for b in boxes), min(b[1] for b in boxes)
+        east, north = max(b[2] for b in boxes), max(b[3] for b in boxes)
+        span = max(east - west, (north - south) * 1.6, 0.01)
+        zoom = min(12.0, max(3.0, math.log2(360 / span) - 0.3))
+        return {"lat": (south + north) / 2, "lon": (west + east) / 2}, zoom